@@ -0,0 +1,104 @@
+import time
+import asyncio
+import statistics
+from typing import Dict, Any, Optional
+from workbench import Listener, Message, QueueManager, ListenerMetadata
+from logging import getLogger, WARNING
+
+logger = getLogger(__name__)
+getLogger("workbench").setLevel(WARNING)
+
+NUM_LISTENERS = 1000
+IDLE_SECONDS = 5
+NUM_HOPS = 1000
+
+
+class IdleListener(Listener):
+    async def _listen(
+        self, message: Message, metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        return message.data
+
+
+async def measure_idle_cpu(queue_manager: QueueManager) -> float:
+    """Start idle listeners and return the CPU seconds burnt per wall second"""
+    listeners = [
+        IdleListener(
+            queue_manager=queue_manager,
+            metadata=ListenerMetadata(
+                listener_id=f"idle-{i}",
+                listener_type="tool",
+                listener_name="Idle Listener",
+            ),
+        )
+        for i in range(NUM_LISTENERS)
+    ]
+    for listener in listeners:
+        await listener.start()
+    # Let every listener reach its blocking wait before measuring
+    await asyncio.sleep(0.5)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    await asyncio.sleep(IDLE_SECONDS)
+    cpu_used = time.process_time() - cpu_start
+    wall_used = time.perf_counter() - wall_start
+
+    for listener in listeners:
+        listener.listener_task.cancel()
+    await asyncio.gather(
+        *[listener.listener_task for listener in listeners], return_exceptions=True
+    )
+    return cpu_used / wall_used
+
+
+async def measure_hop_latency(queue_manager: QueueManager) -> list[float]:
+    """Time how long a message takes to go from a put to a blocked receiver"""
+    latencies = []
+
+    async def receiver():
+        for _ in range(NUM_HOPS):
+            _, json_message = await queue_manager.async_get_message("receiver")
+            sent_at = Message.from_json(json_message).data["sent_at"]
+            latencies.append(time.perf_counter() - sent_at)
+
+    receiver_task = asyncio.create_task(receiver())
+    for hop in range(NUM_HOPS):
+        message = Message(
+            listener_id="sender",
+            data={"sent_at": time.perf_counter()},
+            target_listener="receiver",
+            accessed=False,
+        )
+        await queue_manager.async_put_message(
+            message.to_json(), target_listener=message.target_listener
+        )
+        # Wait for the receiver to block again so every hop is a wakeup
+        while len(latencies) <= hop:
+            await asyncio.sleep(0)
+    await receiver_task
+    return latencies
+
+
+async def main():
+    queue_manager = QueueManager()
+
+    cpu_ratio = await measure_idle_cpu(queue_manager)
+    print(
+        f"Idle CPU with {NUM_LISTENERS} listeners over {IDLE_SECONDS}s: "
+        f"{cpu_ratio * 100:.2f}% of one core"
+    )
+
+    latencies = await measure_hop_latency(queue_manager)
+    latencies_us = sorted(latency * 1e6 for latency in latencies)
+    print(
+        f"Delivery latency over {NUM_HOPS} hops: "
+        f"median {statistics.median(latencies_us):.1f}us, "
+        f"p99 {latencies_us[int(len(latencies_us) * 0.99)]:.1f}us"
+    )
+
+    await queue_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import asyncio
+from typing import Dict, Any, Optional
+from workbench import (
+    Listener,
+    Message,
+    QueueManager,
+    ListenerMetadata,
+    MessageBus,
+    MessageBusFactory,
+    MailboxFull,
+)
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class EchoListener(Listener):
+    async def _listen(
+        self, message: Message, metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        logger.warning(f"EchoListener received message: {message}")
+        return message.data
+
+
+async def check_bus(message_bus: MessageBus):
+    # Messages sent before the mailbox exists must not be lost
+    await message_bus.publish("bus-test", '{"n": 0}')
+    await message_bus.create_mailbox("bus-test")
+    await message_bus.publish("bus-test", '{"n": 1}')
+
+    for expected in ('{"n": 0}', '{"n": 1}'):
+        delivery_id, message_json = await message_bus.consume("bus-test", timeout=1)
+        assert message_json == expected, message_json
+        await message_bus.ack("bus-test", delivery_id)
+
+    try:
+        await message_bus.consume("bus-test", timeout=0.1)
+        raise AssertionError("Expected an empty mailbox")
+    except asyncio.TimeoutError:
+        pass
+    await message_bus.delete_mailbox("bus-test")
+
+
+async def check_listeners(message_bus: MessageBus):
+    queue_manager = QueueManager(message_bus=message_bus)
+    listener = EchoListener(
+        queue_manager=queue_manager,
+        metadata=ListenerMetadata(
+            listener_id="echo-listener",
+            listener_type="tool",
+            listener_name="Echo Listener",
+        ),
+    )
+    await listener.init_async()
+    await listener.start()
+
+    # The reply of the listener lands in the mailbox of the sender
+    await listener._send(
+        Message(
+            listener_id="bus-sender",
+            data={"message": "Test data"},
+            target_listener=listener.listener_id,
+            accessed=False,
+            needs_response=True,
+        )
+    )
+    delivery_id, reply_json = await queue_manager.async_get_message(
+        "bus-sender", timeout=5
+    )
+    await queue_manager.async_ack_message("bus-sender", delivery_id)
+    assert Message.from_json(reply_json).data == {"message": "Test data"}
+
+    await listener.stop()
+    await queue_manager.close()
+
+
+async def check_overflow(bus_type: str):
+    queue_manager = QueueManager(
+        message_bus=MessageBusFactory.create_message_bus(bus_type),
+        mailbox_capacity=2,
+        overflow_policy="reject",
+    )
+    await queue_manager.message_bus.delete_mailbox("overflow-test")
+    for n in range(2):
+        await queue_manager.async_put_message(f'{{"n": {n}}}', "overflow-test")
+    try:
+        await queue_manager.async_put_message('{"n": 2}', "overflow-test")
+        raise AssertionError("Expected a full mailbox")
+    except MailboxFull as e:
+        assert e.retry_after == queue_manager.retry_after
+
+    # Dropping the oldest message keeps the newest ones
+    queue_manager.overflow_policy = "drop_oldest"
+    await queue_manager.async_put_message('{"n": 2}', "overflow-test")
+    for expected in ('{"n": 1}', '{"n": 2}'):
+        delivery_id, message_json = await queue_manager.async_get_message(
+            "overflow-test", timeout=1
+        )
+        assert message_json == expected, message_json
+        await queue_manager.async_ack_message("overflow-test", delivery_id)
+    await queue_manager.message_bus.delete_mailbox("overflow-test")
+    await queue_manager.close()
+
+
+async def main():
+    for bus_type in ("memory", "redis"):
+        await check_bus(MessageBusFactory.create_message_bus(bus_type))
+        await check_listeners(MessageBusFactory.create_message_bus(bus_type))
+        await check_overflow(bus_type)
+        logger.warning(f"{bus_type} message bus OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
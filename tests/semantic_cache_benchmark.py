@@ -0,0 +1,83 @@
+import time
+import statistics
+import numpy as np
+from workbench import SemanticCache, ModelResponse
+
+INDEX_SIZES = [10_000, 100_000, 1_000_000]
+LOOKUPS = 50
+QUESTION = "How do I reset the password of my account?"
+ANSWER = "Use the reset link."
+# Cached question, later question and whether it should get the cached answer
+PAIRS = [
+    (QUESTION, "how do i reset the password for my account", True),
+    (QUESTION, "How can I reset my account password?", True),
+    (QUESTION, "How do I reset the password of my router?", False),
+    ("What is the status of order 12345?", "what's the status of order 12345", True),
+    ("What is the status of order 12345?", "What is the status of order 12346?", False),
+    ("How do I cancel my subscription?", "How do I not cancel my subscription?", False),
+    ("How do I export my data to CSV?", "How do I export my data to PDF?", False),
+    (
+        "Which plan includes priority support?",
+        "which plans include priority support",
+        True,
+    ),
+]
+
+
+def fill(cache: SemanticCache, size: int, batch_size: int = 100_000):
+    """Fill the cache with random unit vectors, then one known question"""
+    rng = np.random.default_rng(0)
+    response = ModelResponse(response_text="Unrelated answer")
+    for start in range(0, size - 1, batch_size):
+        count = min(batch_size, size - 1 - start)
+        embeddings = rng.standard_normal((count, cache.embedder.dim), np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        cache.add_embeddings(embeddings, [response] * count)
+    cache.add(QUESTION, ModelResponse(response_text=ANSWER))
+
+
+def main():
+    threshold = SemanticCache().threshold
+    embedder = SemanticCache().embedder
+    start = time.perf_counter()
+    for _ in range(LOOKUPS):
+        embedder.embed(QUESTION)
+    embed_ms = (time.perf_counter() - start) / LOOKUPS * 1000
+    print(f"embedding: {embed_ms:.3f} ms, default threshold: {threshold}")
+    # Served answers at the default threshold, including wrong ones
+    for cached, query, should_hit in PAIRS:
+        cache = SemanticCache(capacity=1)
+        cache.add(cached, ModelResponse(response_text=ANSWER))
+        similarity = float(embedder.embed(cached) @ embedder.embed(query))
+        served = cache.lookup(query) is not None
+        verdict = (
+            "correct"
+            if served == should_hit
+            else ("false positive" if served else "missed")
+        )
+        print(
+            f"{query:45s}: similarity {similarity:.3f}, "
+            f"{'served' if served else 'not served'} ({verdict})"
+        )
+
+    print("entries | memory MB | lookup p50 ms | lookup p99 ms")
+    for size in INDEX_SIZES:
+        cache = SemanticCache(capacity=size)
+        fill(cache, size)
+        latencies = []
+        for _ in range(LOOKUPS):
+            start = time.perf_counter()
+            response = cache.lookup(QUESTION)
+            latencies.append((time.perf_counter() - start) * 1000)
+        assert response is not None and response.response_text == ANSWER
+        latencies.sort()
+        print(
+            f"{size:7d} | {cache.stats()['memory_bytes'] / 2**20:9.0f} | "
+            f"{statistics.median(latencies):13.3f} | "
+            f"{latencies[int(len(latencies) * 0.99) - 1]:13.3f}"
+        )
+        del cache
+
+
+if __name__ == "__main__":
+    main()
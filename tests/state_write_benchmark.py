@@ -0,0 +1,93 @@
+import time
+import asyncio
+import statistics
+from bson import encode
+from workbench import MongoStateManager, AgentMessage
+from workbench.agents.state_managers import State
+
+CONVERSATION_LENGTHS = [10, 100, 1000]
+TURNS = 20
+MESSAGE = "Could you look into why the nightly export job keeps failing? " * 4
+
+
+def make_state(conversation_id: str, length: int) -> State:
+    return State.from_dict(
+        {
+            "conversation_id": conversation_id,
+            "messages": [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": MESSAGE}
+                for i in range(length)
+            ],
+            "metadata": {"origin": "human-benchmark"},
+        }
+    )
+
+
+def full_write_bytes(state: State) -> int:
+    return len(encode({"$set": state.to_dict()}))
+
+
+def incremental_write_bytes(state: State) -> int:
+    return len(
+        encode(
+            {
+                "$set": {"metadata": state.metadata},
+                "$push": {
+                    "messages": {
+                        "$each": [
+                            message.model_dump() for message in state.new_messages
+                        ]
+                    }
+                },
+            }
+        )
+    )
+
+
+async def time_turns(
+    state_manager: MongoStateManager, conversation_id: str, length: int
+):
+    """Time update_state for a turn adding a user and an assistant message"""
+    await state_manager.collection.delete_one({"conversation_id": conversation_id})
+    state = make_state(conversation_id, length)
+    state.new_messages = None  # Write the existing history in full once
+    await state_manager.update_state(conversation_id=conversation_id, state=state)
+
+    latencies = []
+    state = State.from_dict(
+        await state_manager.get_state(conversation_id=conversation_id)
+    )
+    for _ in range(TURNS):
+        state.add_message(AgentMessage(role="user", content=MESSAGE))
+        state.add_message(AgentMessage(role="assistant", content=MESSAGE))
+        start = time.perf_counter()
+        await state_manager.update_state(conversation_id=conversation_id, state=state)
+        latencies.append(time.perf_counter() - start)
+        state.new_messages = []
+    await state_manager.collection.delete_one({"conversation_id": conversation_id})
+    return statistics.median(latencies) * 1000
+
+
+async def main():
+    full_manager = MongoStateManager()
+    incremental_manager = MongoStateManager(incremental=True)
+
+    print("messages | full write | incremental write | full ms | incremental ms")
+    for length in CONVERSATION_LENGTHS:
+        state = make_state("benchmark", length)
+        state.add_message(AgentMessage(role="user", content=MESSAGE))
+        state.add_message(AgentMessage(role="assistant", content=MESSAGE))
+
+        full_ms = await time_turns(full_manager, "benchmark-full", length)
+        incremental_ms = await time_turns(
+            incremental_manager, "benchmark-incremental", length
+        )
+        print(
+            f"{length:8d} | {full_write_bytes(state):8d} B | "
+            f"{incremental_write_bytes(state):15d} B | "
+            f"{full_ms:7.2f} | {incremental_ms:14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
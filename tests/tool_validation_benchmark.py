@@ -0,0 +1,39 @@
+import timeit
+from jsonschema import validate
+from workbench.tools.tool import compile_validator
+
+CALLS = 10_000
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "to": {"type": "string", "format": "email"},
+        "subject": {"type": "string", "maxLength": 200},
+        "body": {"type": "string"},
+        "cc": {"type": "array", "items": {"type": "string"}},
+        "priority": {"type": "string", "enum": ["low", "normal", "high"]},
+    },
+    "required": ["to", "subject", "body"],
+}
+DATA = {
+    "to": "bob@example.com",
+    "subject": "Nightly export",
+    "body": "The nightly export failed again.",
+    "cc": ["alice@example.com"],
+    "priority": "high",
+}
+
+
+def main():
+    before = timeit.timeit(lambda: validate(DATA, SCHEMA), number=CALLS)
+    validator = compile_validator(SCHEMA)
+    after = timeit.timeit(lambda: validator.is_valid(DATA), number=CALLS)
+    # A replica with the same schema shares the compiled validator
+    assert compile_validator(dict(SCHEMA)) is validator
+
+    print(f"jsonschema.validate per call: {before / CALLS * 1e6:8.2f} us")
+    print(f"compiled validator per call:  {after / CALLS * 1e6:8.2f} us")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
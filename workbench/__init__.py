@@ -1,12 +1,27 @@
 from .listener import Listener, Message
-from .queue_manager import QueueManager, ListenerMetadata
+from .queue_manager import (
+    QueueManager,
+    ListenerMetadata,
+    MailboxFull,
+    PoolUnavailable,
+)
+from .message_buses import (
+    MessageBus,
+    MessageBusFactory,
+    MemoryMessageBus,
+    RedisMessageBus,
+)
 from .agents import (
     Agent,
     ModelFactory,
     ModelConfig,
     ModelResponse,
+    CachedModel,
     AgentMessage,
     AgentConfig,
+    SemanticCache,
+    HashedNgramEmbedder,
+    ToolIndex,
 )
 from .tools import Tool, ToolConfig
 from .agents.state_managers import (
@@ -14,5 +29,6 @@ from .agents.state_managers import (
     StateManagerFactory,
     MongoStateManager,
     DictStateManager,
+    CachedStateManager,
 )
 from .humans import Human, HumanConfig, CLIHuman, TelegramHuman
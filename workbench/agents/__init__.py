@@ -1,3 +1,5 @@
-from .models import ModelFactory, ModelConfig, ModelResponse
+from .models import ModelFactory, ModelConfig, ModelResponse, CachedModel
 from .agent import Agent, AgentConfig
 from .agent_messages import AgentMessage
+from .semantic_cache import SemanticCache, HashedNgramEmbedder
+from .tool_index import ToolIndex
@@ -1,16 +1,42 @@
 from ..listener import Listener, Message
-from ..queue_manager import QueueManager, ListenerMetadata
+from ..queue_manager import (
+    QueueManager,
+    ListenerMetadata,
+    MailboxFull,
+    PoolUnavailable,
+)
 from uuid import uuid4
-from .agent_messages import AgentMessage, AgentInput, AgentOutput
-from typing import List, Literal, Dict, Any, Optional
+from .agent_messages import AgentMessage, AgentInput, AgentOutput, estimate_tokens
+from typing import (
+    List,
+    Literal,
+    Dict,
+    Any,
+    Optional,
+    Callable,
+    Awaitable,
+    Tuple,
+    Set,
+)
 from pydantic import BaseModel, ValidationError
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 from .models import ModelConfig, ModelResponse, ModelFactory
 from .state_managers import StateManager, DictStateManager, State
+from .semantic_cache import SemanticCache
+from .tool_index import ToolIndex
 from logging import getLogger
+import asyncio
+import json
+import time
 
 logger = getLogger(__name__)
 
+COMPACTION_SYSTEM_PROMPT = (
+    "You summarise conversations between a user and an AI agent. Keep every fact, "
+    "decision, open question and tool result the agent may need later, and leave "
+    "out pleasantries. Reply with the summary only."
+)
+
 
 @dataclass
 class AgentConfig:
@@ -20,6 +46,22 @@ class AgentConfig:
     state_manager: Optional[StateManager] = DictStateManager()
     agent_description: str = "An AI Agent"
     keep_last_messages: int = 10
+    max_concurrency: int = 1
+    # When set, the history sent to the model is windowed to this many tokens
+    # instead of keeping the last keep_last_messages messages
+    token_budget: Optional[int] = None
+    token_counter: Callable[[str], int] = estimate_tokens
+    # When set, a (cheaper) model folds older turns into a summary in the background
+    # once the history is longer than compaction_threshold messages
+    compaction_model_config: Optional[ModelConfig] = None
+    compaction_threshold: int = 40
+    compaction_keep_last: int = 10
+    # Answer questions similar to ones answered before in the same context from cache
+    semantic_cache: Optional[SemanticCache] = None
+    # When set, only the tool_top_k listeners most relevant to a message are offered
+    tool_top_k: Optional[int] = None
+    # Seconds tool calls get to respond before the agent carries on without them
+    tool_call_timeout: Optional[float] = None
 
 
 class Agent(Listener):
@@ -36,6 +78,21 @@ class Agent(Listener):
             f"You are an AI agent. Your goal is to {self.agent_description}."
         )
         self.keep_last_messages = config.keep_last_messages
+        self.token_budget = config.token_budget
+        self.token_counter = config.token_counter
+        self.semantic_cache = config.semantic_cache
+        self.tool_top_k = config.tool_top_k
+        self.tool_index = ToolIndex() if config.tool_top_k else None
+        self.tool_call_timeout = config.tool_call_timeout
+        self._tool_call_timers: Set[asyncio.Task] = set()
+        self.compaction_threshold = config.compaction_threshold
+        self.compaction_keep_last = config.compaction_keep_last
+        self.compaction_llm = None
+        # Compaction in progress for each conversation
+        self._compactions: Dict[str, asyncio.Task] = {}
+        if config.compaction_model_config:
+            config.compaction_model_config.system_prompt = COMPACTION_SYSTEM_PROMPT
+            self.compaction_llm = ModelFactory.create(config.compaction_model_config)
         agent_metadata = ListenerMetadata(
             listener_type="agent",
             listener_id=self.agent_id,
@@ -44,7 +101,11 @@ class Agent(Listener):
             input_schema=AgentInput.model_json_schema(),
             output_schema=AgentOutput.model_json_schema(),
         )
-        super().__init__(config.queue_manager, agent_metadata)
+        super().__init__(
+            config.queue_manager,
+            agent_metadata,
+            max_concurrency=config.max_concurrency,
+        )
         self.base_llm = ModelFactory.create(self.model_config)
 
     async def _process_message(self, message: Message) -> AgentMessage:
@@ -52,6 +113,8 @@ class Agent(Listener):
             listener_id=message.listener_id
         )
         if isinstance(message.data, dict):
+            if message.data.get("status") in ("timeout", "rejected"):
+                return AgentMessage(role="user", content=message.data["error"])
             try:
                 # Try to parse the message with the input schema of the agent
                 input_message = AgentMessage(**message.data)
@@ -100,43 +163,156 @@ class Agent(Listener):
 
         conversation_state = State.from_dict(raw_state)
         logger.debug(f"Conversation state: {conversation_state}")
-        # IMPROVE: Need other strategies to manage the messages
-        conversation_state.truncate_messages(keep_last=self.keep_last_messages)
-        logger.debug(f"Conversation state after truncation: {conversation_state}")
         input_message = await self._process_message(message)
+        # Listener and correlation id of the request this turn answers, if any
+        requester = None
+        if message.in_reply_to is not None:
+            group_id = message.in_reply_to.rpartition(":")[0]
+            group = conversation_state.metadata.get("pending_tool_calls", {}).get(
+                group_id, {}
+            )
+            requester = group.get("requester")
+            # Wait for the results of every tool call made by the same response
+            input_message = await self._gather_tool_result(
+                conversation_state, message.in_reply_to, input_message
+            )
+            if input_message is None:
+                return {"status": "tool_call"}
+        elif message.correlation_id is not None:
+            requester = {
+                "listener_id": message.listener_id,
+                "correlation_id": message.correlation_id,
+            }
+        # With compaction the full history is kept until it is summarised
+        if self.token_budget is None and self.compaction_llm is None:
+            conversation_state.truncate_messages(keep_last=self.keep_last_messages)
+            logger.debug(f"Conversation state after truncation: {conversation_state}")
         # Add the incoming message to the conversation history
         conversation_state.add_message(input_message)
-        connected_listeners = await self.get_connected_listeners(
+        if self.token_budget is not None and self.compaction_llm is None:
+            conversation_state.window_messages(
+                self.token_budget, counter=self.token_counter
+            )
+            logger.debug(f"Conversation state after windowing: {conversation_state}")
+        catalog_key, connected_listeners = await self._get_connected_listeners_snapshot(
             avoid_listeners=avoid_listeners
         )
-        response = await self.base_llm.generate_response(
-            conversation_state.messages, connected_listeners
-        )
+        if self.tool_index is not None and len(connected_listeners) > self.tool_top_k:
+            catalog_key, connected_listeners = await self._select_tools(
+                input_message.content, catalog_key, connected_listeners
+            )
+        on_chunk = None
+        if self.model_config.stream:
+            # Stream the response to the listener that gets the final one
+            stream_target = message.listener_id
+            if listener_metadata["listener_type"] == "tool":
+                stream_target = conversation_state.metadata.get("origin", stream_target)
+            on_chunk = self._chunk_sender(stream_target, original_conversation_id)
+        prompt_messages = self._prompt_messages(conversation_state)
+        response = None
+        cache_context = None
+        if self.semantic_cache is not None and message.in_reply_to is None:
+            # Questions only match those asked after the same history
+            cache_context = json.dumps(
+                [prompt_message.to_prompt() for prompt_message in prompt_messages[:-1]]
+            )
+            cached_response = await self.semantic_cache.async_lookup(
+                input_message.content, context=cache_context
+            )
+            if cached_response is not None:
+                response = replace(cached_response, cache_hit=True)
+        if response is None:
+            response = await self.base_llm.generate_response(
+                prompt_messages,
+                connected_listeners,
+                catalog_key=catalog_key,
+                on_chunk=on_chunk,
+            )
+            # Tool calls are not cached, their arguments depend on the exact question
+            if cache_context is not None and not response.tool_use:
+                self.semantic_cache.add(
+                    input_message.content, response, context=cache_context
+                )
         # Update the state
         conversation_state.add_message(
             AgentMessage(role="assistant", content=response.response_text)
         )
-        await self.state_manager.update_state(
-            conversation_id=original_conversation_id, state=conversation_state
-        )
-        # This response might be a tool call, so we need to handle it
-        if response.tool_use:
-            target_listener = response.target_listener
-            tool_data = response.tool_args
-            tool_message = Message(
-                listener_id=self.agent_id,
-                data=tool_data,  # Tool specific message that adhers to the tool schema
-                target_listener=target_listener,
-                accessed=False,
-                conversation_id=original_conversation_id,
-                needs_response=True,  # Ask for a response from the tool
-            )
-            # Send a message to the tool listener
-            await self._send(tool_message)
+        tool_messages = []
+        if response.tool_use and response.tool_calls:
+            group_id = uuid4().hex[:8]
+            conversation_state.metadata.setdefault("pending_tool_calls", {})[
+                group_id
+            ] = {
+                "calls": [asdict(call) for call in response.tool_calls],
+                "results": {},
+                "requester": requester,
+            }
+            deadline = message.deadline
+            if self.tool_call_timeout is not None:
+                # Calls made on behalf of a caller must not outlive its deadline
+                deadline = min(
+                    time.time() + self.tool_call_timeout, deadline or float("inf")
+                )
+            tool_messages = [
+                Message(
+                    listener_id=self.agent_id,
+                    data=call.tool_args,  # Tool specific message that adhers to the tool schema
+                    target_listener=call.target_listener,
+                    accessed=False,
+                    conversation_id=original_conversation_id,
+                    needs_response=True,  # Ask for a response from the tool
+                    correlation_id=f"{group_id}:{index}",
+                    deadline=deadline,
+                )
+                for index, call in enumerate(response.tool_calls)
+            ]
+        if (
+            self.compaction_llm is not None
+            and len(conversation_state.messages) > self.compaction_threshold
+            and original_conversation_id not in self._compactions
+        ):
+            # Summarises a snapshot of the history while the conversation goes on
+            compaction = asyncio.create_task(
+                self._compact_conversation(
+                    original_conversation_id,
+                    list(conversation_state.messages),
+                    conversation_state.metadata.get("summary"),
+                )
+            )
+            self._compactions[original_conversation_id] = compaction
+            compaction.add_done_callback(
+                lambda _: self._compactions.pop(original_conversation_id, None)
+            )
+        # This response might be tool calls, so we need to handle them
+        try:
+            await self.state_manager.update_state(
+                conversation_id=original_conversation_id, state=conversation_state
+            )
+            if tool_messages:
+                await self._send_tool_calls(
+                    conversation_state, response, tool_messages, group_id, deadline
+                )
+        except asyncio.CancelledError:
+            if tool_messages:
+                # No result would ever complete the group
+                await self._discard_tool_calls(original_conversation_id, group_id)
+            raise
+        if tool_messages:
             return {"status": "tool_call"}
         # Do not need to invoke any other listener
+        if message.in_reply_to is not None and requester is not None:
+            # Answer the request that led to the tool calls
+            return {
+                "status": "response",
+                "response": asdict(response),
+                "override": requester["listener_id"],
+                "in_reply_to": requester["correlation_id"],
+            }
         # If the message came from a tool override the message to the origin listener
-        if listener_metadata["listener_type"] == "tool":
+        if (
+            message.in_reply_to is not None
+            or listener_metadata["listener_type"] == "tool"
+        ):
             metadata = conversation_state.metadata
             if metadata and metadata.get("origin"):
                 override = metadata["origin"]
@@ -146,3 +322,281 @@ class Agent(Listener):
                     "override": override,
                 }
         return {"status": "response", "response": asdict(response)}
+
+    async def _send_tool_calls(
+        self,
+        conversation_state: State,
+        response: ModelResponse,
+        tool_messages: List[Message],
+        group_id: str,
+        deadline: Optional[float],
+    ):
+        """Send the calls of a response, failing those the tools cannot take"""
+        conversation_id = conversation_state.conversation_id
+        # Send the calls to the tool listeners all at once, their results
+        # are gathered before the model is called again
+        sent = await asyncio.gather(
+            *[self._send(tool_message) for tool_message in tool_messages],
+            return_exceptions=True,
+        )
+        failures = {}
+        for index, result in enumerate(sent):
+            if isinstance(result, MailboxFull):
+                # The tool is overloaded, let the model decide what to do
+                failures[index] = {
+                    "status": "rejected",
+                    "error": f"{response.tool_calls[index].tool_name} is overloaded, "
+                    f"retry after {result.retry_after} seconds",
+                    "retry_after": result.retry_after,
+                }
+            elif isinstance(result, PoolUnavailable):
+                failures[index] = {
+                    "status": "rejected",
+                    "error": f"{response.tool_calls[index].tool_name} has no "
+                    "running replicas",
+                }
+            elif isinstance(result, Exception):
+                raise result
+        if failures:
+            self._schedule_in_conversation(
+                conversation_id,
+                self._fail_tool_calls(
+                    conversation_id,
+                    group_id,
+                    failures,
+                    conversation_state.metadata.get("origin"),
+                ),
+            )
+        if deadline is not None:
+            self._start_tool_call_timer(conversation_id, group_id, deadline)
+
+    async def _discard_tool_calls(self, conversation_id: str, group_id: str):
+        """Forget a group of tool calls whose sending was interrupted"""
+        state = State.from_dict(
+            await self.state_manager.get_state(conversation_id=conversation_id)
+        )
+        if state.metadata.get("pending_tool_calls", {}).pop(group_id, None) is not None:
+            await self.state_manager.update_state(
+                conversation_id=conversation_id, state=state
+            )
+
+    def _start_tool_call_timer(
+        self, conversation_id: str, group_id: str, deadline: float
+    ):
+        """Time out the calls of a group still unanswered at the deadline"""
+
+        async def expire():
+            await asyncio.sleep(max(deadline - time.time(), 0))
+            self._schedule_in_conversation(
+                conversation_id, self._expire_tool_calls(conversation_id, group_id)
+            )
+
+        timer = asyncio.create_task(expire())
+        self._tool_call_timers.add(timer)
+        timer.add_done_callback(self._tool_call_timers.discard)
+
+    async def _expire_tool_calls(self, conversation_id: str, group_id: str):
+        """Answer the calls of a group that are still pending with a timeout"""
+        state = await self.state_manager.get_state(conversation_id=conversation_id)
+        group = state["metadata"].get("pending_tool_calls", {}).get(group_id)
+        if group is None:
+            return
+        failures = {
+            index: {
+                "status": "timeout",
+                "error": f"The call to {call['tool_name']} timed out without a result",
+            }
+            for index, call in enumerate(group["calls"])
+            if str(index) not in group["results"]
+        }
+        await self._fail_tool_calls(
+            conversation_id, group_id, failures, state["metadata"].get("origin")
+        )
+
+    async def _fail_tool_calls(
+        self,
+        conversation_id: str,
+        group_id: str,
+        failures: Dict[int, Dict[str, Any]],
+        origin: Optional[str],
+    ):
+        """Answer tool calls of a group with the given failure results"""
+        try:
+            for index, failure in failures.items():
+                logger.warning(f"Tool call {group_id}:{index} failed: {failure}")
+                # Handled like a result sent by the tool, the last one resumes the turn
+                await self._handle_message(
+                    Message(
+                        listener_id=self.agent_id,
+                        data=failure,
+                        target_listener=self.agent_id,
+                        accessed=False,
+                        conversation_id=conversation_id,
+                        needs_response=origin is not None,
+                        in_reply_to=f"{group_id}:{index}",
+                    )
+                )
+        except Exception as e:
+            logger.error(
+                f"Failed to answer tool calls of conversation {conversation_id}: {str(e)}"
+            )
+
+    async def stop(self):
+        for timer in list(self._tool_call_timers):
+            timer.cancel()
+        for compaction in list(self._compactions.values()):
+            compaction.cancel()
+        await super().stop()
+
+    async def _select_tools(
+        self,
+        query: str,
+        catalog_key: Tuple,
+        connected_listeners: List[ListenerMetadata],
+    ) -> Tuple[Tuple, List[ListenerMetadata]]:
+        """Narrow the connected listeners down to the most relevant ones"""
+        version, listeners = await self.queue_manager.async_get_registry_snapshot()
+        self.tool_index.sync(version, listeners)
+        selected = self.tool_index.select(query, connected_listeners, self.tool_top_k)
+        # Ranked by relevance the same tools would come in a different order
+        # from turn to turn, a fixed order keeps the tools input, its memo and
+        # the cached prompt prefix the same while the selection is
+        selected = sorted(selected, key=lambda listener: listener.address)
+        logger.debug(f"Selected tools: {[listener.address for listener in selected]}")
+        # The tools input is memoized per selection
+        catalog_key = (*catalog_key, tuple(listener.address for listener in selected))
+        return catalog_key, selected
+
+    async def _gather_tool_result(
+        self, conversation_state: State, in_reply_to: str, result: AgentMessage
+    ) -> Optional[AgentMessage]:
+        """
+        Record the result of a tool call. Returns the message holding the results
+        of all the calls made along with it once the last one is in, None before.
+        """
+        group_id, _, index = in_reply_to.rpartition(":")
+        pending = conversation_state.metadata.get("pending_tool_calls", {})
+        group = pending.get(group_id)
+        if group is None or index in group["results"]:
+            # Calls answered already, e.g. with a timeout, or made before a restart
+            logger.warning(f"Ignoring result of tool call {in_reply_to}")
+            return None
+        group["results"][index] = result.model_dump(include={"role", "content"})
+        if len(group["results"]) < len(group["calls"]):
+            await self.state_manager.update_state(
+                conversation_id=conversation_state.conversation_id,
+                state=conversation_state,
+            )
+            return None
+        del pending[group_id]
+        if len(group["calls"]) == 1:
+            return AgentMessage(**group["results"]["0"])
+        results = "\n\n".join(
+            f"[{index + 1}] {call['tool_name']}:\n{group['results'][str(index)]['content']}"
+            for index, call in enumerate(group["calls"])
+        )
+        return AgentMessage(
+            role="user", content=f"Results of the tool calls:\n\n{results}"
+        )
+
+    def _chunk_sender(
+        self, target_listener: str, conversation_id: str
+    ) -> Callable[[str], Awaitable[None]]:
+        """Build a callback sending chunks of a streamed response as messages"""
+
+        async def send_chunk(text: str):
+            try:
+                await self._send(
+                    Message(
+                        listener_id=self.agent_id,
+                        data={"status": "chunk", "text": text},
+                        target_listener=target_listener,
+                        accessed=False,
+                        conversation_id=conversation_id,
+                    ),
+                    # Waiting for room would hold up the response being streamed
+                    overflow_policy="reject",
+                )
+            except (MailboxFull, PoolUnavailable):
+                # Chunks are best effort, the complete response follows anyway
+                logger.debug(f"Dropped a chunk for {target_listener}")
+
+        return send_chunk
+
+    def _prompt_messages(self, conversation_state: State) -> List[AgentMessage]:
+        """The history sent to the model, preceded by the summary of older turns"""
+        messages = conversation_state.messages
+        if self.compaction_llm is None:
+            return messages
+        if self.token_budget is not None:
+            window = State(
+                conversation_id=conversation_state.conversation_id,
+                messages=list(messages),
+                metadata=conversation_state.metadata,
+            )
+            window.window_messages(self.token_budget, counter=self.token_counter)
+            messages = window.messages
+        summary = conversation_state.metadata.get("summary")
+        if summary:
+            summary_message = AgentMessage(
+                role="user", content=f"Summary of the earlier conversation:\n{summary}"
+            )
+            messages = [summary_message, *messages]
+        return messages
+
+    async def _compact_conversation(
+        self,
+        conversation_id: str,
+        messages: List[AgentMessage],
+        previous_summary: Optional[str],
+    ):
+        """
+        Fold all but the last compaction_keep_last of a snapshot of the messages
+        of a conversation into the summary stored in its metadata
+        """
+        try:
+            folded = messages[: -self.compaction_keep_last]
+            transcript = "\n\n".join(
+                f"{message.role}: {message.content}" for message in folded
+            )
+            if previous_summary:
+                transcript = (
+                    f"Summary so far:\n{previous_summary}\n\n"
+                    f"Conversation since then:\n{transcript}"
+                )
+            response = await self.compaction_llm.generate_response(
+                [AgentMessage(role="user", content=transcript)]
+            )
+            # Merged in order with the turns that ran in the meantime
+            await self._schedule_in_conversation(
+                conversation_id,
+                self._merge_summary(conversation_id, folded, response.response_text),
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to compact conversation {conversation_id}: {str(e)}")
+
+    async def _merge_summary(
+        self, conversation_id: str, folded: List[AgentMessage], summary: str
+    ):
+        """Replace the folded messages with their summary, keeping newer messages"""
+        state = State.from_dict(
+            await self.state_manager.get_state(conversation_id=conversation_id)
+        )
+        if state.messages[: len(folded)] != folded:
+            logger.warning(
+                f"History of conversation {conversation_id} changed during compaction"
+            )
+            return
+        compacted_state = State(
+            conversation_id=conversation_id,
+            messages=state.messages[len(folded) :],
+            metadata={**state.metadata, "summary": summary},
+        )
+        await self.state_manager.update_state(
+            conversation_id=conversation_id, state=compacted_state
+        )
+        logger.debug(
+            f"Compacted {len(folded)} messages of conversation {conversation_id}"
+        )
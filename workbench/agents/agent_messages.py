@@ -1,15 +1,32 @@
 from pydantic import BaseModel, Field
-from typing import Literal, TypeVar
+from pydantic.json_schema import SkipJsonSchema
+from typing import Callable, Literal, Optional, TypeVar
 import json
 
 T = TypeVar("T", bound="AgentMessage")
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, assuming about four characters per token"""
+    return len(text) // 4 + 1
+
+
 class AgentMessage(BaseModel):
     role: Literal["user", "assistant"] = Field(
         description="The role of the message sender - can be user or assistant"
     )
     content: str = Field(description="The actual content/text of the message")
+    # Stored with the message so it is only counted once
+    token_count: SkipJsonSchema[Optional[int]] = None
+
+    def count_tokens(self, counter: Callable[[str], int] = estimate_tokens) -> int:
+        if self.token_count is None:
+            self.token_count = counter(self.content)
+        return self.token_count
+
+    def to_prompt(self) -> dict:
+        """The message as sent to the model providers"""
+        return {"role": self.role, "content": self.content}
 
     def to_json(self):
         return json.dumps(self.model_dump())
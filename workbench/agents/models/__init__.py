@@ -1,2 +1,3 @@
-from .base_llm import ModelConfig, ModelResponse 
+from .base_llm import ModelConfig, ModelResponse, ToolCall
 from .factory import ModelFactory
+from .cached_model import CachedModel
@@ -1,6 +1,6 @@
-from .base_llm import BaseLLM, ModelConfig, ModelResponse
+from .base_llm import BaseLLM, ModelConfig, ModelResponse, ToolCall
 from anthropic import AsyncAnthropic, AsyncAnthropicBedrock
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Hashable, Callable, Awaitable
 from ..agent_messages import AgentMessage
 from ...listener import ListenerMetadata
 import os
@@ -8,6 +8,8 @@ from logging import getLogger
 
 logger = getLogger(__name__)
 
+CACHE_CONTROL = {"type": "ephemeral"}
+
 
 class AnthropicModel(BaseLLM):
     def __init__(self, model_config: ModelConfig):
@@ -32,12 +34,17 @@ class AnthropicModel(BaseLLM):
             return []
         tools_input = [
             {
-                "name": f"{listener.listener_name}__{listener.listener_id}",
+                "name": f"{listener.listener_name}__{listener.address}",
                 "description": listener.description,
                 "input_schema": listener.input_schema,
             }
             for listener in connected_listeners
         ]
+        if self.prompt_caching:
+            # The cache prefix runs tools, then system, then messages: this
+            # breakpoint covers the tools only, the one on the system prompt
+            # covers tools plus system and is still needed
+            tools_input[-1]["cache_control"] = CACHE_CONTROL
         logger.debug(f"Tools input: {tools_input}")
         return tools_input
 
@@ -45,38 +52,72 @@ class AnthropicModel(BaseLLM):
         self,
         messages: List[AgentMessage],
         connected_listeners: Optional[List[ListenerMetadata]] = None,
+        catalog_key: Optional[Hashable] = None,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> ModelResponse:
         logger.debug(f"Messages: {messages}")
-        messages = [message.model_dump() for message in messages]
-        tools_input = self.construct_tools_input(connected_listeners)
+        messages = [message.to_prompt() for message in messages]
+        tools_input = self.get_tools_input(connected_listeners, catalog_key)
+        system = self.system_prompt
+        if self.prompt_caching:
+            system = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+            messages = self.mark_cached_history(messages)
 
-        response = await self.client.messages.create(
+        request = dict(
             messages=messages,
-            system=self.system_prompt,
+            system=system,
             model=self.model_name,
             tools=tools_input,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
         )
+        if self.stream and on_chunk is not None:
+            async with self.client.messages.stream(**request) as stream:
+                async for text in stream.text_stream:
+                    await on_chunk(text)
+                response = await stream.get_final_message()
+        else:
+            response = await self.client.messages.create(**request)
 
         logger.debug(f"Response: {response}")
         parsed_response = self.parse_response(response)
         logger.debug(f"Parsed response: {parsed_response}")
         return parsed_response
 
+    @staticmethod
+    def mark_cached_history(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Put a cache breakpoint on the last message, so the next turn of the
+        conversation reads the history up to here from the cache
+        """
+        if not messages or not messages[-1]["content"]:
+            return messages
+        last_message = messages[-1]
+        return messages[:-1] + [
+            {
+                "role": last_message["role"],
+                "content": [
+                    {
+                        "type": "text",
+                        "text": last_message["content"],
+                        "cache_control": CACHE_CONTROL,
+                    }
+                ],
+            }
+        ]
+
     def parse_response(self, response) -> ModelResponse:
         logger.debug(f"Response to parse: {response}")
         response_text = ""
         tool_use = False
-        tool_name = None
-        target_listener = None
-        tool_args = None
+        tool_calls = []
         for block in response.content:
             if block.type == "text":
                 response_text = block.text
             elif block.type == "tool_use":
                 tool_args = block.input
                 tool_name, target_listener = block.name.split("__")
+                tool_calls.append(ToolCall(tool_name, target_listener, tool_args))
                 # Add tool call details to response text
                 tool_details = f"\n\nTool Call Details:\nTool: {tool_name}\nListener: {target_listener}\nArguments: {tool_args}"
                 response_text = response_text + tool_details if response_text else tool_details
@@ -87,9 +128,13 @@ class AnthropicModel(BaseLLM):
         return ModelResponse(
             response_text=response_text,
             tool_use=tool_use,
-            tool_name=tool_name,
-            target_listener=target_listener,
-            tool_args=tool_args,
+            tool_calls=tool_calls,
             output_tokens=response.usage.output_tokens,
             input_tokens=response.usage.input_tokens,
+            cache_creation_input_tokens=getattr(
+                response.usage, "cache_creation_input_tokens", None
+            ),
+            cache_read_input_tokens=getattr(
+                response.usage, "cache_read_input_tokens", None
+            ),
         )
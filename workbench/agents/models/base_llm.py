@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import List, Literal, Dict, Any, Optional
+from typing import List, Literal, Dict, Any, Optional, Hashable, Callable, Awaitable
 from ..agent_messages import AgentMessage, AgentOutput
 from ...listener import ListenerMetadata
-from dataclasses import dataclass
+from ...cache import LRUCache
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ToolCall:
+    tool_name: str
+    target_listener: Optional[str] = None
+    tool_args: Optional[Dict[str, Any]] = None
 
 
 @dataclass
@@ -12,8 +20,26 @@ class ModelResponse:
     tool_use: bool = False
     tool_name: Optional[str] = None
     tool_args: Optional[Dict[str, Any]] = None
+    # Every tool call of the response, the fields above hold the first one
+    tool_calls: List[ToolCall] = field(default_factory=list)
     output_tokens: Optional[int] = None
     input_tokens: Optional[int] = None
+    # Input tokens written to and read from the provider's prompt cache
+    cache_creation_input_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    # Served from the response cache rather than generated
+    cache_hit: bool = False
+
+    def __post_init__(self):
+        if self.tool_calls and self.tool_name is None:
+            first_call = self.tool_calls[0]
+            self.tool_name = first_call.tool_name
+            self.target_listener = first_call.target_listener
+            self.tool_args = first_call.tool_args
+        elif self.tool_name is not None and not self.tool_calls:
+            self.tool_calls = [
+                ToolCall(self.tool_name, self.target_listener, self.tool_args)
+            ]
 
 
 @dataclass
@@ -25,6 +51,14 @@ class ModelConfig:
     response_format: Optional[str] = None
     system_prompt: str = "You are a helpful assistant."
     stream: bool = False
+    # Mark the stable prefix of the prompt for caching. Off by default: not every
+    # model or hosting provider accepts cache_control, enable it for those that do
+    prompt_caching: bool = False
+    # Serve repeated requests from a cache of responses, see CachedModel
+    response_cache: bool = False
+    response_cache_size: int = 1024
+    response_cache_ttl: Optional[float] = 3600
+    response_cache_redis: bool = False
 
     @property
     def provider(self) -> Literal["anthropic", "openai", "ollama"]:
@@ -47,16 +81,40 @@ class BaseLLM(ABC):
         self.temperature = model_config.temperature
         self.system_prompt = model_config.system_prompt
         self.stream = model_config.stream
+        self.prompt_caching = model_config.prompt_caching
+        # Tools inputs memoized per catalog key
+        self._tool_catalogs = LRUCache(maxsize=128)
 
     @abstractmethod
     async def generate_response(
         self,
         messages: List[AgentMessage],
         connected_listeners: Optional[List[ListenerMetadata]] = None,
+        catalog_key: Optional[Hashable] = None,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> ModelResponse:
-        """Generate a response from the LLM"""
+        """
+        Generate a response from the LLM. The catalog key identifies the set of
+        connected listeners, so their tools input is only constructed once.
+        When the model streams, on_chunk is awaited with every piece of text as
+        it arrives and the complete response is returned at the end.
+        """
         pass
 
+    def get_tools_input(
+        self,
+        connected_listeners: Optional[List[ListenerMetadata]],
+        catalog_key: Optional[Hashable] = None,
+    ) -> List[Dict[str, Any]]:
+        """Construct the tools input, reusing it for a catalog key seen before"""
+        if catalog_key is None:
+            return self.construct_tools_input(connected_listeners)
+        tools_input = self._tool_catalogs.get(catalog_key)
+        if tools_input is None:
+            tools_input = self.construct_tools_input(connected_listeners)
+            self._tool_catalogs.set(catalog_key, tools_input)
+        return tools_input
+
     @abstractmethod
     async def construct_tools_input(
         self, connected_listeners: List[ListenerMetadata]
@@ -0,0 +1,140 @@
+from .base_llm import BaseLLM, ModelConfig, ModelResponse, ToolCall
+from typing import List, Dict, Any, Optional, Hashable, Callable, Awaitable
+from ..agent_messages import AgentMessage
+from ...listener import ListenerMetadata
+from ...cache import REDIS, LRUCache
+from redis.asyncio import Redis
+from dataclasses import asdict, replace
+from logging import getLogger
+import hashlib
+import json
+
+logger = getLogger(__name__)
+
+
+class CachedModel(BaseLLM):
+    """
+    Serves repeated requests to another model from a cache of its responses,
+    kept in an in-process LRU in front of an optional Redis. Requests are keyed
+    on the model, temperature, system prompt, messages and tools.
+    """
+
+    def __init__(
+        self,
+        model: BaseLLM,
+        model_config: ModelConfig,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 3600,
+        use_redis: bool = False,
+        redis: Optional[Redis] = None,
+        prefix: str = "llm_responses",
+    ):
+        super().__init__(model_config)
+        self.model = model
+        self.local_cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.redis = (redis or REDIS) if use_redis else None
+        self.ttl = ttl
+        self.prefix = prefix
+        # Hashes of the tools input memoized per catalog key
+        self._catalog_hashes = LRUCache(maxsize=128)
+        self.hits = 0
+        self.misses = 0
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+
+    def construct_tools_input(
+        self, connected_listeners: List[ListenerMetadata]
+    ) -> List[Dict[str, Any]]:
+        return self.model.construct_tools_input(connected_listeners)
+
+    def parse_response(self, response: Dict[str, Any]) -> ModelResponse:
+        return self.model.parse_response(response)
+
+    def _catalog_hash(
+        self,
+        connected_listeners: Optional[List[ListenerMetadata]],
+        catalog_key: Optional[Hashable],
+    ) -> str:
+        catalog_hash = (
+            self._catalog_hashes.get(catalog_key) if catalog_key is not None else None
+        )
+        if catalog_hash is None:
+            tools_input = self.model.get_tools_input(connected_listeners, catalog_key)
+            catalog_hash = hashlib.sha256(
+                json.dumps(tools_input, sort_keys=True, default=str).encode()
+            ).hexdigest()
+            if catalog_key is not None:
+                self._catalog_hashes.set(catalog_key, catalog_hash)
+        return catalog_hash
+
+    def cache_key(
+        self,
+        messages: List[AgentMessage],
+        connected_listeners: Optional[List[ListenerMetadata]] = None,
+        catalog_key: Optional[Hashable] = None,
+    ) -> str:
+        request = {
+            "model": self.model.model_name,
+            "temperature": self.model.temperature,
+            "system_prompt": self.model.system_prompt,
+            "messages": [message.to_prompt() for message in messages],
+            "tools": self._catalog_hash(connected_listeners, catalog_key),
+        }
+        return hashlib.sha256(
+            json.dumps(request, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    async def _get_cached(self, key: str) -> Optional[ModelResponse]:
+        response = self.local_cache.get(key)
+        if response is None and self.redis is not None:
+            cached_data = await self.redis.get(f"{self.prefix}_{key}")
+            if cached_data:
+                data = json.loads(cached_data)
+                data["tool_calls"] = [ToolCall(**call) for call in data["tool_calls"]]
+                response = ModelResponse(**data)
+                self.local_cache.set(key, response)
+        return response
+
+    async def _cache(self, key: str, response: ModelResponse):
+        self.local_cache.set(key, response)
+        if self.redis is not None:
+            ttl = int(self.ttl) if self.ttl is not None else None
+            status = await self.redis.set(
+                f"{self.prefix}_{key}", json.dumps(asdict(response)), ex=ttl
+            )
+            if not status:
+                logger.warning(f"Caching failed for the response {key}")
+
+    async def generate_response(
+        self,
+        messages: List[AgentMessage],
+        connected_listeners: Optional[List[ListenerMetadata]] = None,
+        catalog_key: Optional[Hashable] = None,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> ModelResponse:
+        key = self.cache_key(messages, connected_listeners, catalog_key)
+        cached_response = await self._get_cached(key)
+        if cached_response is not None:
+            self.hits += 1
+            self.saved_input_tokens += cached_response.input_tokens or 0
+            self.saved_output_tokens += cached_response.output_tokens or 0
+            logger.debug(f"Response cache hit for {key}")
+            return replace(cached_response, cache_hit=True)
+
+        self.misses += 1
+        response = await self.model.generate_response(
+            messages, connected_listeners, catalog_key=catalog_key, on_chunk=on_chunk
+        )
+        await self._cache(key, response)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_input_tokens": self.saved_input_tokens,
+            "saved_output_tokens": self.saved_output_tokens,
+            "local": self.local_cache.stats(),
+        }
@@ -1,4 +1,5 @@
 from .base_llm import ModelConfig
+from .cached_model import CachedModel
 from logging import getLogger
 import importlib
 
@@ -17,6 +18,14 @@ class ModelFactory:
         )
         class_ = getattr(module, class_name)
         instance = class_(model_config)
+        if model_config.response_cache:
+            instance = CachedModel(
+                instance,
+                model_config,
+                maxsize=model_config.response_cache_size,
+                ttl=model_config.response_cache_ttl,
+                use_redis=model_config.response_cache_redis,
+            )
         return instance
 
     # except (ImportError, AttributeError):
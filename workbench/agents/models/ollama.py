@@ -1,7 +1,8 @@
-from .base_llm import BaseLLM, ModelConfig, ModelResponse
-from typing import List, Dict, Any, Optional
+from .base_llm import BaseLLM, ModelConfig, ModelResponse, ToolCall
+from typing import List, Dict, Any, Optional, Hashable, Callable, Awaitable
 from ..agent_messages import AgentMessage
 from ...listener import ListenerMetadata
+from ...cache import LRUCache
 from ollama import AsyncClient
 from logging import getLogger
 import re
@@ -20,6 +21,8 @@ class OllamaModel(BaseLLM):
             self.system_prompt = f"{self.system_prompt}\n\n{f'Respond in the following format only: \n{model_config.response_format}'}"
         self.model_name = self.get_ollama_name(self.model_name)
         self.client = AsyncClient()
+        # Formatted system prompts memoized per catalog key
+        self._system_prompts = LRUCache(maxsize=128)
 
     def get_ollama_name(self, model_name: str) -> str:
         return model_name.split("/")[1]
@@ -31,7 +34,7 @@ class OllamaModel(BaseLLM):
             return []
         tools_input = [
             {
-                "name": f"{listener.listener_name}__{listener.listener_id}",
+                "name": f"{listener.listener_name}__{listener.address}",
                 "description": listener.description,
                 "input_schema": listener.input_schema,
             }
@@ -44,25 +47,68 @@ class OllamaModel(BaseLLM):
         self,
         messages: List[AgentMessage],
         connected_listeners: Optional[List[ListenerMetadata]] = None,
+        catalog_key: Optional[Hashable] = None,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> ModelResponse:
         logger.debug(f"Messages: {messages}")
-        tools_input = self.construct_tools_input(connected_listeners)
-        system_prompt = self.get_system_prompt(tools_input)
-        if self.system_prompt:
-            system_prompt = f"{system_prompt}\n\n{self.system_prompt}"
+        system_prompt = (
+            self._system_prompts.get(catalog_key) if catalog_key is not None else None
+        )
+        if system_prompt is None:
+            tools_input = self.get_tools_input(connected_listeners, catalog_key)
+            system_prompt = self.get_system_prompt(tools_input)
+            if self.system_prompt:
+                system_prompt = f"{system_prompt}\n\n{self.system_prompt}"
+            if catalog_key is not None:
+                self._system_prompts.set(catalog_key, system_prompt)
         current_messages = [{"role": "system", "content": system_prompt}]
-        messages = [*current_messages, *[message.model_dump() for message in messages]]
+        messages = [*current_messages, *[message.to_prompt() for message in messages]]
 
-        response = await self.client.chat(
-            messages=messages,
-            model=self.model_name,
-        )
+        if self.stream and on_chunk is not None:
+            response = await self.stream_response(messages, on_chunk)
+        else:
+            response = await self.client.chat(
+                messages=messages,
+                model=self.model_name,
+            )
 
         logger.debug(f"Response: {response}")
         parsed_response = self.parse_response(response)
         logger.debug(f"Parsed response: {parsed_response}")
         return parsed_response
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, Any]],
+        on_chunk: Callable[[str], Awaitable[None]],
+    ):
+        """
+        Stream the completion, passing text to on_chunk as it arrives, and
+        return the final part holding the complete content. Tool calls are
+        written in the content, so a completion opening with a bracket is not
+        passed on.
+        """
+        content = ""
+        is_tool_call = None
+        # Stays None for a stream without parts, parsed as an empty response
+        part = None
+        async for part in await self.client.chat(
+            messages=messages,
+            model=self.model_name,
+            stream=True,
+        ):
+            text = part.message.content or ""
+            content += text
+            if is_tool_call is None and content.strip():
+                is_tool_call = content.lstrip().startswith("[")
+                # The text held back until the completion could be told apart
+                text = content
+            if text and is_tool_call is False:
+                await on_chunk(text)
+        if part is not None:
+            part.message.content = content
+        return part
+
     def get_system_prompt(self, tools_input: List[Dict[str, Any]]) -> str:
         # IMPROVE: This will only work for llama3.2 this should be some config
         template = """You are an expert in composing functions. You are given a question and a set of possible functions. 
@@ -80,9 +126,7 @@ class OllamaModel(BaseLLM):
         logger.debug(f"Response to parse: {response}")
         response_text = ""
         tool_use = False
-        tool_name = None
-        target_listener = None
-        tool_args = None
+        tool_calls = []
 
         # Get the message content from the response
         if hasattr(response, "message"):
@@ -90,15 +134,16 @@ class OllamaModel(BaseLLM):
             parsed_content = self.parse_content(response_text)
             if isinstance(parsed_content, list) and len(parsed_content) > 0:
                 tool_use = True
-                # Get the first function call
-                first_call = parsed_content[0]
-                function_name = first_call["name"]
-                # Split function name into tool_name and target_listener if it contains "__"
-                if "__" in function_name:
-                    tool_name, target_listener = function_name.split("__")
-                else:
-                    tool_name = function_name
-                tool_args = first_call["args"]
+                for function_call in parsed_content:
+                    function_name = function_call["name"]
+                    # Split function name into tool_name and target_listener if it contains "__"
+                    if "__" in function_name:
+                        tool_name, target_listener = function_name.split("__")
+                    else:
+                        tool_name, target_listener = function_name, None
+                    tool_calls.append(
+                        ToolCall(tool_name, target_listener, function_call["args"])
+                    )
 
         # Get token counts from the response
         input_tokens = getattr(response, "prompt_eval_count", 0)
@@ -107,9 +152,7 @@ class OllamaModel(BaseLLM):
         return ModelResponse(
             response_text=response_text,
             tool_use=tool_use,
-            tool_name=tool_name,
-            target_listener=target_listener,
-            tool_args=tool_args,
+            tool_calls=tool_calls,
             output_tokens=output_tokens,
             input_tokens=input_tokens,
         )
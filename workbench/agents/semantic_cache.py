@@ -0,0 +1,188 @@
+from .models import ModelResponse
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet
+from logging import getLogger
+import asyncio
+import hashlib
+import re
+import zlib
+import numpy as np
+
+logger = getLogger(__name__)
+
+# Words that do not change what a question asks for, left out of its embedding
+STOP_WORDS = frozenset(
+    "a an the of for to in on at by with from about my your our their his her "
+    "its i you we they me us it this that is are was were be been am do does "
+    "did can could would should will shall may might how what when where which "
+    "who why please".split()
+)
+# Words that turn a question into its opposite
+NEGATIONS = frozenset("not no never nor none nothing cannot without".split())
+
+
+def words_of(text: str) -> List[str]:
+    """Lowercase words of a text without punctuation, "n't" spelled out as "not" """
+    text = re.sub(r"n't\b", " not", text.lower())
+    return re.findall(r"\w+", re.sub(r"'(s|re|ve|ll|d|m)\b", "", text))
+
+
+class HashedNgramEmbedder:
+    """
+    Embeds text as the normalized counts of its character n-grams, hashed into
+    a fixed number of dimensions. Texts sharing most of their n-grams get a
+    cosine similarity close to 1. Stop words, if given, are left out first.
+    """
+
+    def __init__(
+        self,
+        dim: int = 256,
+        ngram_range: Tuple[int, int] = (3, 5),
+        stop_words: Optional[FrozenSet[str]] = None,
+    ):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.stop_words = stop_words or frozenset()
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if self.stop_words:
+            words = words_of(text)
+            content_words = [word for word in words if word not in self.stop_words]
+            text = " ".join(content_words or words)
+        text = f" {' '.join(text.lower().split())} "
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for start in range(len(text) - n + 1):
+                # crc32 rather than hash() so embeddings are stable across processes
+                bucket = zlib.crc32(text[start : start + n].encode()) % self.dim
+                vector[bucket] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """
+    Cache of model responses looked up by the similarity of the question they
+    answer. Embeddings live in an array preallocated for capacity entries and
+    are searched with a single matrix product. Once full, the oldest entries
+    are overwritten first.
+
+    Entries only match questions asked in the same context, e.g. after the same
+    conversation history, identified by a context string, and with the same
+    numbers, identifiers and negations: "order 12345" never matches
+    "order 12346", however similar they are otherwise.
+
+    Lookups are a matrix product over every entry, about 15 ms at 100k entries
+    of 256 dimensions, use async_lookup to keep them off the event loop.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 10000,
+        threshold: float = 0.9,
+        embedder: Optional[HashedNgramEmbedder] = None,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.embedder = embedder or HashedNgramEmbedder(stop_words=STOP_WORDS)
+        self._embeddings = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        self._contexts = np.zeros(capacity, dtype=np.int64)
+        self._responses: List[Optional[ModelResponse]] = [None] * capacity
+        self._size = 0
+        # Slot written next, wrapping around to the oldest entry once full
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def context_id(context: str) -> int:
+        digest = hashlib.sha256(context.encode()).digest()
+        return int.from_bytes(digest[:8], "little", signed=True)
+
+    @staticmethod
+    def guarded_words(question: str) -> List[str]:
+        """Words a cached question must share exactly: numbers, ids and negations"""
+        return [
+            word
+            for word in words_of(question)
+            if word in NEGATIONS or any(char.isdigit() for char in word)
+        ]
+
+    def _entry_context_id(self, question: str, context: str) -> int:
+        guarded = " ".join(self.guarded_words(question))
+        return self.context_id(f"{context}\x00{guarded}" if guarded else context)
+
+    def lookup(self, question: str, context: str = "") -> Optional[ModelResponse]:
+        """Get the response to the most similar question, if similar enough"""
+        # Entries added while a lookup runs in a thread are not searched
+        size = self._size
+        if size == 0:
+            self.misses += 1
+            return None
+        scores = self._embeddings[:size] @ self.embedder.embed(question)
+        scores[self._contexts[:size] != self._entry_context_id(question, context)] = (
+            -1.0
+        )
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug(f"Semantic cache hit with similarity {scores[best]:.3f}")
+        return self._responses[best]
+
+    async def async_lookup(
+        self, question: str, context: str = ""
+    ) -> Optional[ModelResponse]:
+        """lookup run in a thread, so other listeners keep running meanwhile"""
+        return await asyncio.to_thread(self.lookup, question, context)
+
+    def add(self, question: str, response: ModelResponse, context: str = "") -> None:
+        self._add(
+            self.embedder.embed(question)[np.newaxis, :],
+            [response],
+            self._entry_context_id(question, context),
+        )
+
+    def add_embeddings(
+        self,
+        embeddings: np.ndarray,
+        responses: List[ModelResponse],
+        context: str = "",
+    ) -> None:
+        """
+        Add entries from embeddings computed ahead, e.g. to warm the cache. They
+        only match questions without numbers, identifiers or negations.
+        """
+        self._add(embeddings, responses, self.context_id(context))
+
+    def _add(
+        self, embeddings: np.ndarray, responses: List[ModelResponse], context_id: int
+    ) -> None:
+        written = 0
+        while written < len(responses):
+            # Fill the slots up to the end of the array, then wrap around
+            count = min(len(responses) - written, self.capacity - self._next)
+            end = self._next + count
+            self._embeddings[self._next : end] = embeddings[written : written + count]
+            self._contexts[self._next : end] = context_id
+            self._responses[self._next : end] = responses[written : written + count]
+            self._size = max(self._size, end)
+            self._next = end % self.capacity
+            written += count
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "memory_bytes": self._embeddings.nbytes + self._contexts.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
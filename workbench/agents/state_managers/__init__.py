@@ -2,4 +2,5 @@ from .factory import StateManagerFactory
 from .base_manager import StateManager
 from .dict_manager import DictStateManager
 from .mongo_manager import MongoStateManager
+from .cached_manager import CachedStateManager
 from .state import State
\ No newline at end of file
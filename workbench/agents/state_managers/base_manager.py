@@ -1,24 +1,25 @@
 from abc import ABC, abstractmethod
 from .state import State
-from ...cache import from_cache, cache
 from typing import Dict, Any, Optional
 
 
 class StateManager(ABC):
-    @from_cache(prefix="states", kwarg_name="conversation_id")
     @abstractmethod
     async def get_state(
         self, conversation_id: str, metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        Asynchronously get the latest state from cache, or from the source if not in cache.
+        Asynchronously get the latest state, or a new state with the given
+        metadata if the conversation has none yet.
         """
         pass
 
-    @cache(prefix="states", kwarg_name="conversation_id")
     @abstractmethod
-    async def update_state(self, conversation_id: str, state: State) -> Dict[str, Any]:
+    async def update_state(
+        self, conversation_id: str, state: State
+    ) -> Optional[Dict[str, Any]]:
         """
-        Asynchronously update and return the state so it can be cached.
+        Asynchronously update and return the state so it can be cached, or
+        return None when the stored state is not read back.
         """
         pass
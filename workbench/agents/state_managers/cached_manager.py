@@ -0,0 +1,183 @@
+from .base_manager import StateManager
+from .mongo_manager import MongoStateManager
+from .state import State
+from ...cache import REDIS, LRUCache
+from redis.asyncio import Redis
+from typing import Dict, Any, Optional
+from logging import getLogger
+from uuid import uuid4
+import asyncio
+import copy
+import json
+
+logger = getLogger(__name__)
+
+# Redis pub/sub channel announcing updated conversation states
+STATE_EVENTS_CHANNEL = "workbench:state_events"
+
+
+class CachedStateManager(StateManager):
+    """
+    Caches the states of another state manager in an in-process LRU, in front
+    of Redis, in front of the backend. Updates are written through to every
+    tier, and concurrent misses for a conversation share a single load. States
+    the backend does not read back after an update are dropped from the cache
+    instead.
+
+    Updates are announced through Redis pub/sub so other processes drop their
+    local copy. Without Redis, the local copy of a state updated by another
+    process is served until it expires after ttl seconds.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[StateManager] = None,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 300,
+        use_redis: bool = True,
+        redis: Optional[Redis] = None,
+        redis_ttl: int = 3600,
+        prefix: str = "states",
+    ):
+        self.backend = backend or MongoStateManager()
+        self.local_cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.redis = (redis or REDIS) if use_redis else None
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.backend_loads = 0
+        # Loads in progress, shared by concurrent callers of the same conversation
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Tells the updates of this instance apart from those of other processes
+        self._instance_id = uuid4().hex
+        self._state_events_task: Optional[asyncio.Task] = None
+        # Bumped on every invalidation, loads that overlap one are not kept locally
+        self._invalidations = 0
+
+    def _cache_key(self, conversation_id: str) -> str:
+        return f"{self.prefix}_{conversation_id}"
+
+    def _ensure_state_events_subscription(self):
+        if self.redis is None:
+            return
+        if self._state_events_task is None or self._state_events_task.done():
+            self._state_events_task = asyncio.create_task(
+                self._listen_for_state_events()
+            )
+
+    async def _listen_for_state_events(self):
+        """Drop local copies of states updated by other processes"""
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(STATE_EVENTS_CHANNEL)
+            async for event in pubsub.listen():
+                if event["type"] != "message":
+                    continue
+                state_event = json.loads(event["data"])
+                if state_event["source"] == self._instance_id:
+                    continue
+                self.local_cache.delete(state_event["conversation_id"])
+                self._invalidations += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stopped listening for state events: {str(e)}")
+        finally:
+            await pubsub.aclose()
+
+    async def get_state(
+        self, conversation_id: str, metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        self._ensure_state_events_subscription()
+        state = self.local_cache.get(conversation_id)
+        if state is None:
+            task = self._loading.get(conversation_id)
+            if task is None:
+                task = asyncio.ensure_future(
+                    self._load_state(conversation_id, metadata)
+                )
+                self._loading[conversation_id] = task
+                task.add_done_callback(
+                    lambda _: self._loading.pop(conversation_id, None)
+                )
+            # Shielded so a cancelled caller does not cancel the load for the others
+            state = await asyncio.shield(task)
+        # Callers change their state in place, the cached one must stay as stored
+        return copy.deepcopy(state)
+
+    async def _load_state(
+        self, conversation_id: str, metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        invalidations = self._invalidations
+        if self.redis is not None:
+            cached_data = await self.redis.get(self._cache_key(conversation_id))
+            if cached_data:
+                self.redis_hits += 1
+                state = json.loads(cached_data)
+                if self._invalidations == invalidations:
+                    self.local_cache.set(conversation_id, state)
+                return state
+            self.redis_misses += 1
+
+        self.backend_loads += 1
+        state = await self.backend.get_state(
+            conversation_id=conversation_id, metadata=metadata
+        )
+        # New conversations are not cached until they are first updated, and
+        # states loaded while another process updated one may be stale
+        if state["messages"] and self._invalidations == invalidations:
+            await self._cache_state(conversation_id, state)
+        return state
+
+    async def _cache_state(self, conversation_id: str, state: Dict[str, Any]):
+        self.local_cache.set(conversation_id, state)
+        if self.redis is not None:
+            status = await self.redis.set(
+                self._cache_key(conversation_id), json.dumps(state), ex=self.redis_ttl
+            )
+            if not status:
+                logger.warning(f"Caching failed for the state of {conversation_id}")
+
+    async def _invalidate_state(self, conversation_id: str):
+        self.local_cache.delete(conversation_id)
+        self._invalidations += 1
+        if self.redis is not None:
+            await self.redis.delete(self._cache_key(conversation_id))
+
+    async def update_state(
+        self, conversation_id: str, state: State
+    ) -> Optional[Dict[str, Any]]:
+        updated_state = await self.backend.update_state(
+            conversation_id=conversation_id, state=state
+        )
+        if updated_state is not None:
+            await self._cache_state(conversation_id, updated_state)
+        else:
+            # The backend did not read the state back, the next get loads it
+            await self._invalidate_state(conversation_id)
+        if self.redis is not None:
+            self._ensure_state_events_subscription()
+            await self.redis.publish(
+                STATE_EVENTS_CHANNEL,
+                json.dumps(
+                    {"conversation_id": conversation_id, "source": self._instance_id}
+                ),
+            )
+        return updated_state
+
+    async def close(self):
+        if self._state_events_task:
+            self._state_events_task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        redis_lookups = self.redis_hits + self.redis_misses
+        return {
+            "local": self.local_cache.stats(),
+            "redis": {
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "hit_rate": self.redis_hits / redis_lookups if redis_lookups else 0.0,
+            },
+            "backend": {"loads": self.backend_loads},
+        }
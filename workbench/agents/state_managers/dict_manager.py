@@ -1,29 +1,173 @@
 from .base_manager import StateManager
 from .state import State
 from typing import Dict, Any, Optional
+from collections import OrderedDict
+from logging import getLogger
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+logger = getLogger(__name__)
 
 
 class DictStateManager(StateManager):
-    def __init__(self):
-        # In-memory dictionary to store state per conversation_id
-        self.state_dict: Dict[str, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        max_conversations: Optional[int] = None,
+        ttl: Optional[float] = None,
+        spill_path: Optional[str] = None,
+    ):
+        """
+        Keeps at most max_conversations states in memory, evicting the least
+        recently used ones and those not accessed for ttl seconds. Evicted
+        states are spilled to a SQLite file at spill_path, if given, and loaded
+        back when their conversation is accessed again.
+        """
+        # In-memory dictionary to store state per conversation_id, least recently used first
+        self.state_dict: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self.evictions = 0
+        self.spills = 0
+        self.spill_loads = 0
+
+        self.spill_path = spill_path
+        self._spill_lock = threading.Lock()
+        self._spill_db = None
+        # States being written to the spill file, still readable meanwhile
+        self._spilling: Dict[str, Dict[str, Any]] = {}
+        # Loads from the spill file in progress, shared by concurrent callers
+        self._loading: Dict[str, asyncio.Task] = {}
+        if spill_path:
+            self._spill_db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill_db.execute(
+                "CREATE TABLE IF NOT EXISTS states "
+                "(conversation_id TEXT PRIMARY KEY, state TEXT NOT NULL)"
+            )
+            self._spill_db.commit()
 
     async def get_state(
         self, conversation_id: str, metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         if metadata is None:
             metadata = {}
+        state = self.state_dict.get(conversation_id)
+        if state is not None:
+            self._touch(conversation_id)
+        elif self._spill_db is not None:
+            task = self._loading.get(conversation_id)
+            if task is None:
+                task = asyncio.ensure_future(self._load(conversation_id))
+                self._loading[conversation_id] = task
+                task.add_done_callback(
+                    lambda _: self._loading.pop(conversation_id, None)
+                )
+            # Shielded so a cancelled caller does not lose the state for the others
+            state = await asyncio.shield(task)
+        if self.ttl is not None:
+            # Idle states expire even when no conversation is being updated
+            await self._evict()
         # Return saved state; if none exists, return a default state
-        return self.state_dict.get(
-            conversation_id,
-            {
+        if state is None:
+            return {
                 "conversation_id": conversation_id,
                 "messages": [],
                 "metadata": metadata,
-            },
-        )
+            }
+        return state
 
     async def update_state(self, conversation_id: str, state: State) -> Dict[str, Any]:
         # Update the state and return it as a dictionary
-        self.state_dict[conversation_id] = state.to_dict()
+        await self._store(conversation_id, state.to_dict())
         return self.state_dict[conversation_id]
+
+    async def _load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Move a spilled state back in memory. Concurrent callers share the
+        load, the state being neither in memory nor in the spill file meanwhile
+        """
+        state = self._spilling.get(conversation_id)
+        if state is None:
+            state = await asyncio.to_thread(self._load_spilled, conversation_id)
+        if state is None:
+            return None
+        self.spill_loads += 1
+        # Keep the state written by an update during the load
+        state = self.state_dict.get(conversation_id, state)
+        await self._store(conversation_id, state)
+        return state
+
+    def _touch(self, conversation_id: str):
+        self.state_dict.move_to_end(conversation_id)
+        self._last_access[conversation_id] = time.monotonic()
+
+    async def _store(self, conversation_id: str, state: Dict[str, Any]):
+        self.state_dict[conversation_id] = state
+        self._sizes[conversation_id] = sum(
+            len(message["content"].encode()) for message in state["messages"]
+        )
+        self._touch(conversation_id)
+        await self._evict()
+
+    async def _evict(self):
+        """Evict expired states and the least recently used ones over capacity"""
+        now = time.monotonic()
+        while self.state_dict:
+            conversation_id = next(iter(self.state_dict))
+            over_capacity = (
+                self.max_conversations is not None
+                and len(self.state_dict) > self.max_conversations
+            )
+            expired = (
+                self.ttl is not None
+                and now - self._last_access[conversation_id] > self.ttl
+            )
+            if not (over_capacity or expired):
+                break
+            state = self.state_dict.pop(conversation_id)
+            del self._last_access[conversation_id]
+            del self._sizes[conversation_id]
+            self.evictions += 1
+            if self._spill_db is not None:
+                self._spilling[conversation_id] = state
+                try:
+                    await asyncio.to_thread(self._spill, conversation_id, state)
+                finally:
+                    self._spilling.pop(conversation_id, None)
+                self.spills += 1
+
+    def _spill(self, conversation_id: str, state: Dict[str, Any]):
+        with self._spill_lock:
+            self._spill_db.execute(
+                "INSERT OR REPLACE INTO states (conversation_id, state) VALUES (?, ?)",
+                (conversation_id, json.dumps(state)),
+            )
+            self._spill_db.commit()
+
+    def _load_spilled(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._spill_lock:
+            row = self._spill_db.execute(
+                "SELECT state FROM states WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            # The state lives in memory again until it is evicted next
+            self._spill_db.execute(
+                "DELETE FROM states WHERE conversation_id = ?", (conversation_id,)
+            )
+            self._spill_db.commit()
+        return json.loads(row[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self.state_dict),
+            "content_bytes": sum(self._sizes.values()),
+            "evictions": self.evictions,
+            "spills": self.spills,
+            "spill_loads": self.spill_loads,
+        }
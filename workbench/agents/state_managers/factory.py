@@ -4,7 +4,9 @@ from typing import Literal
 
 class StateManagerFactory:
     @staticmethod
-    def create_state_manager(manager_type: Literal["dict", "mongo"]) -> StateManager:
-        module = importlib.import_module(f".{manager_type}_manager")
+    def create_state_manager(
+        manager_type: Literal["dict", "mongo", "cached"], **kwargs
+    ) -> StateManager:
+        module = importlib.import_module(f".{manager_type}_manager", package=__package__)
         cls_ = getattr(module, f"{manager_type.capitalize()}StateManager")
-        return cls_()
+        return cls_(**kwargs)
@@ -7,11 +7,17 @@ import os
 
 
 class MongoStateManager(StateManager):
-    def __init__(self):
+    def __init__(self, incremental: bool = False, max_messages: Optional[int] = None):
+        """
+        In incremental mode only the messages added since the state was loaded
+        are pushed to the stored history, capped to the last max_messages.
+        """
         self.mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
         self.client = AsyncIOMotorClient(self.mongo_uri)
         self.db = self.client["listener_db"]
         self.collection = self.db["states"]
+        self.incremental = incremental
+        self.max_messages = max_messages
 
     async def get_state(
         self, conversation_id: str, metadata: Optional[Dict[str, Any]] = None
@@ -29,7 +35,12 @@ class MongoStateManager(StateManager):
             }
         return state
 
-    async def update_state(self, conversation_id: str, state: State) -> Dict[str, Any]:
+    async def update_state(
+        self, conversation_id: str, state: State
+    ) -> Optional[Dict[str, Any]]:
+        # States that do not track their new messages are written in full
+        if self.incremental and state.new_messages is not None:
+            return await self._append_state(conversation_id, state)
         updated_state = await self.collection.find_one_and_update(
             {"conversation_id": conversation_id},
             {"$set": state.to_dict()},
@@ -38,3 +49,22 @@ class MongoStateManager(StateManager):
             projection={"_id": False},
         )
         return updated_state
+
+    async def _append_state(self, conversation_id: str, state: State) -> None:
+        """
+        Push the new messages of the state without reading back the document.
+        The stored history may hold more messages than the state, so nothing
+        is returned for caching
+        """
+        update = {"$set": {"metadata": state.metadata}}
+        if state.new_messages:
+            push = {"$each": [message.model_dump() for message in state.new_messages]}
+            if self.max_messages:
+                push["$slice"] = -self.max_messages
+            update["$push"] = {"messages": push}
+        else:
+            update["$setOnInsert"] = {"messages": []}
+        await self.collection.update_one(
+            {"conversation_id": conversation_id}, update, upsert=True
+        )
+        state.new_messages = []
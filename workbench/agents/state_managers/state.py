@@ -1,6 +1,6 @@
-from dataclasses import dataclass
-from ..agent_messages import AgentMessage
-from typing import List, Dict, Any, TypeVar
+from dataclasses import dataclass, field
+from ..agent_messages import AgentMessage, estimate_tokens
+from typing import List, Dict, Any, TypeVar, Optional, Callable
 from pydantic import BaseModel
 
 T = TypeVar("T", bound="State")
@@ -10,19 +10,42 @@ class State:
     conversation_id: str
     messages: List[AgentMessage]
     metadata: Dict[str, Any]
+    # Messages added since the state was loaded, None when not tracked
+    new_messages: Optional[List[AgentMessage]] = field(
+        default=None, repr=False, compare=False
+    )
 
     # IMPROVE: This is a temporary solution to limit the number of messages in the state
     def truncate_messages(self, keep_last: int = 10) -> None:
         self.messages = self.messages[-keep_last:]
+
+    def window_messages(
+        self, token_budget: int, counter: Callable[[str], int] = estimate_tokens
+    ) -> None:
+        """
+        Keep the most recent messages that fit in the token budget, and always
+        at least the last message
+        """
+        total_tokens = 0
+        keep_from = len(self.messages)
+        for index in range(len(self.messages) - 1, -1, -1):
+            total_tokens += self.messages[index].count_tokens(counter)
+            if total_tokens > token_budget and keep_from < len(self.messages):
+                break
+            keep_from = index
+        self.messages = self.messages[keep_from:]
     
     def add_message(self, message: AgentMessage) -> None:
         self.messages.append(message)
+        if self.new_messages is not None:
+            self.new_messages.append(message)
 
     @classmethod
     def from_dict(cls: type[T], data: Dict[str, Any]) -> T:
         return cls(conversation_id=data['conversation_id'],
                    messages=[AgentMessage(**message) for message in data['messages']],
-                   metadata=data['metadata'])
+                   metadata=data['metadata'],
+                   new_messages=[])
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -0,0 +1,71 @@
+from .semantic_cache import HashedNgramEmbedder
+from ..queue_manager import ListenerMetadata
+from typing import List, Dict, Any, Optional
+from logging import getLogger
+import json
+import numpy as np
+
+logger = getLogger(__name__)
+
+
+class ToolIndex:
+    """
+    Ranks listeners by the relevance of their name, description and input
+    schema to a query. The index follows the listener registry: on a new
+    registry version only the listeners that attached, changed or detached
+    are embedded or dropped.
+    """
+
+    def __init__(self, embedder: Optional[HashedNgramEmbedder] = None):
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.version: Optional[int] = None
+        self._texts: Dict[str, str] = {}
+        self._embeddings: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def listener_text(listener: ListenerMetadata) -> str:
+        return (
+            f"{listener.listener_name}\n{listener.description}\n"
+            f"{json.dumps(listener.input_schema, sort_keys=True)}"
+        )
+
+    def _index(self, listener: ListenerMetadata) -> None:
+        text = self.listener_text(listener)
+        if self._texts.get(listener.address) != text:
+            self._texts[listener.address] = text
+            self._embeddings[listener.address] = self.embedder.embed(text)
+
+    def sync(self, version: int, listeners: List[Dict[str, Any]]) -> None:
+        """Bring the index up to date with a snapshot of the registry"""
+        if version == self.version:
+            return
+        addresses = set()
+        for listener in listeners:
+            metadata = ListenerMetadata(**listener)
+            addresses.add(metadata.address)
+            self._index(metadata)
+        for address in set(self._texts) - addresses:
+            del self._texts[address]
+            del self._embeddings[address]
+        self.version = version
+        logger.debug(f"Tool index synced to version {version}: {len(self._texts)}")
+
+    def select(
+        self, query: str, candidates: List[ListenerMetadata], k: int
+    ) -> List[ListenerMetadata]:
+        """The k candidates most relevant to the query, most relevant first"""
+        if len(candidates) <= k:
+            return candidates
+        for candidate in candidates:
+            if candidate.address not in self._embeddings:
+                self._index(candidate)
+        embeddings = np.stack(
+            [self._embeddings[candidate.address] for candidate in candidates]
+        )
+        scores = embeddings @ self.embedder.embed(query)
+        top = np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [candidates[index] for index in top]
+
+    def __len__(self) -> int:
+        return len(self._texts)
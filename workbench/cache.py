@@ -1,6 +1,8 @@
 from redis.asyncio import Redis
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
 import os
-import json
+import time
 from logging import getLogger
 
 logger = getLogger(__name__)
@@ -20,57 +22,58 @@ REDIS = Redis(
 )
 
 
-def cache_data(key, data, **kwargs):
-    status = REDIS.set(key, json.dumps(data), **kwargs)
-    logger.info(f"Caching {key}")
-    return status
+class LRUCache:
+    """
+    In-process LRU cache with an optional time-to-live and hit/miss counters
+    """
 
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-def fetch_cache(key):
-    return REDIS.get(key)
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
 
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
 
-def cache(prefix, kwarg_name="exp_id", ex=300, transformer=lambda x: x):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            output = func(*args, **kwargs)
-            exp_id = kwargs.get(kwarg_name)
-            exp_id = transformer(exp_id)
-            key = f"{prefix}_{exp_id}"
-            status = cache_data(key, output, ex=ex)
-            if not status:
-                logger.warning(
-                    f"Caching failed for the function call {func._name__} with args {args} and kwargs {kwargs}"
-                )
-            return output
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
 
-        return wrapper
+    def clear(self) -> None:
+        self._data.clear()
 
-    return decorator
+    def __len__(self) -> int:
+        return len(self._data)
 
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
-def from_cache(prefix, kwarg_name="exp_id", transformer=lambda x: x, ex=300):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            exp_id = kwargs.get(kwarg_name)
-            exp_id = transformer(exp_id)
-            key = f"{prefix}_{exp_id}"
-            logger.info(f"Transformed key: {key}")
-            data = fetch_cache(key)
-            if data:
-                output = json.loads(data)
-            else:
-                logger.info(
-                    f"Cache not found for the function call {func.__name__} with args {args} and kwargs {kwargs}"
-                )
-                output = func(*args, **kwargs)
-                status = cache_data(key, output, ex=ex)
-                if not status:
-                    logger.warning(
-                        f"Caching failed for the function call {func.__name__} with args {args} and kwargs {kwargs}"
-                    )
-            return output
-
-        return wrapper
-
-    return decorator
@@ -14,12 +14,26 @@ class CLIHuman(Human):
         super().__init__(config)
         # Create a lock for synchronizing console I/O
         self._console_lock = threading.Lock()
+        # Conversations with a response being streamed to the console
+        self._streaming = set()
 
     def _safe_print(self, message: str):
         """Thread-safe printing to console"""
         with self._console_lock:
             print(message, flush=True)
 
+    def _safe_write(self, text: str):
+        """Thread-safe printing to console without a newline"""
+        with self._console_lock:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    async def _on_chunk(self, message: Message):
+        if message.conversation_id not in self._streaming:
+            self._streaming.add(message.conversation_id)
+            self._safe_print(f"\nNew message from {message.listener_id}:")
+        self._safe_write(message.data["text"])
+
     def _safe_input(self, prefix: str = "") -> str:
         """Thread-safe input from console"""
         with self._console_lock:
@@ -45,15 +59,21 @@ class CLIHuman(Human):
                 prefix = "User:" if msg["role"] == "user" else "Assistant:"
                 self._safe_print(f"{prefix} {msg['content']}\n")
 
-        # Print new message
-        self._safe_print(f"\nNew message from {listener_id}:")
-        if isinstance(message.data, dict):
-            if "content" in message.data:
-                self._safe_print(message.data["content"])
+        # Print new message, unless it was already streamed
+        if conversation_id in self._streaming:
+            self._streaming.discard(conversation_id)
+            self._safe_print("")
+        else:
+            self._safe_print(f"\nNew message from {listener_id}:")
+            if isinstance(message.data, dict):
+                if "content" in message.data:
+                    self._safe_print(message.data["content"])
+                elif message.data.get("status") == "rejected":
+                    self._safe_print(message.data["error"])
+                else:
+                    self._safe_print(str(message.data))
             else:
                 self._safe_print(str(message.data))
-        else:
-            self._safe_print(str(message.data))
 
         self._safe_print("\nWaiting for user input (press Enter twice to finish)...")
 
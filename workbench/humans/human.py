@@ -1,7 +1,12 @@
 from abc import abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from ..listener import Listener, Message
-from ..queue_manager import QueueManager, ListenerMetadata
+from ..queue_manager import (
+    QueueManager,
+    ListenerMetadata,
+    MailboxFull,
+    PoolUnavailable,
+)
 from dataclasses import dataclass, field
 from ..agents.agent_messages import AgentInput
 from ..agents.state_managers import StateManager, DictStateManager
@@ -22,6 +27,7 @@ class HumanConfig:
         default_factory=HumanProtocol.model_json_schema
     )
     output_schema: Dict[str, Any] = field(default_factory=AgentInput.model_json_schema)
+    max_concurrency: int = 1
 
 
 class Human(Listener):
@@ -34,7 +40,9 @@ class Human(Listener):
             input_schema=config.input_schema,
             output_schema=config.output_schema,
         )
-        super().__init__(config.queue_manager, metadata)
+        super().__init__(
+            config.queue_manager, metadata, max_concurrency=config.max_concurrency
+        )
         self.state_manager = config.state_manager
 
     @abstractmethod
@@ -52,3 +60,24 @@ class Human(Listener):
             Dict[str, Any]: The processed response data from the human
         """
         pass
+
+    async def _on_rejected(
+        self, message: Message, error: Union[MailboxFull, PoolUnavailable]
+    ):
+        """
+        Show the human that their message was not delivered, their answer is
+        sent in its place
+        """
+        await self._handle_message(
+            Message(
+                listener_id=message.target_listener,
+                data={
+                    "status": "rejected",
+                    "error": f"Your message was not delivered: {str(error)}",
+                    "retry_after": getattr(error, "retry_after", None),
+                },
+                target_listener=self.listener_id,
+                accessed=False,
+                conversation_id=message.conversation_id,
+            )
+        )
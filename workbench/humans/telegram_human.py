@@ -3,6 +3,7 @@ from workbench.humans.human import Human, HumanConfig
 from workbench.listener import Message
 import aiohttp
 import asyncio
+import time
 from typing import Dict, Any, Optional
 from ..agents.state_managers import State
 
@@ -10,13 +11,21 @@ logger = logging.getLogger(__name__)
 
 
 class TelegramHuman(Human):
-    def __init__(self, config: HumanConfig, telegram_token: str, chat_id: int):
+    def __init__(
+        self,
+        config: HumanConfig,
+        telegram_token: str,
+        chat_id: int,
+        stream_edit_interval: float = 1.0,
+    ):
         """
         Initialize a TelegramHuman that uses a Telegram bot to communicate with a human user.
 
         :param config: HumanConfig instance.
         :param telegram_token: Bot token provided by BotFather.
         :param chat_id: The Telegram chat ID for the human user.
+        :param stream_edit_interval: Minimum seconds between edits of a message
+            showing a streamed response, to stay within Telegram's rate limits.
         """
         super().__init__(config)
         self.telegram_token = telegram_token
@@ -24,6 +33,10 @@ class TelegramHuman(Human):
         self.base_url = f"https://api.telegram.org/bot{telegram_token}"
         self.updates_url = f"{self.base_url}/getUpdates"
         self.send_url = f"{self.base_url}/sendMessage"
+        self.edit_url = f"{self.base_url}/editMessageText"
+        self.stream_edit_interval = stream_edit_interval
+        # Streamed responses per conversation: message id, text, text shown, last edit
+        self._streams: Dict[str, Dict[str, Any]] = {}
 
     def _escape_markdown(self, text: str) -> str:
         """
@@ -60,6 +73,39 @@ class TelegramHuman(Human):
 
         return text
 
+    async def _on_chunk(self, message: Message):
+        """
+        Show a streamed response in a single Telegram message, edited as the
+        text grows.
+        """
+        stream = self._streams.setdefault(
+            message.conversation_id,
+            {"message_id": None, "text": "", "shown": "", "edited_at": 0.0},
+        )
+        stream["text"] += message.data["text"]
+        if time.monotonic() - stream["edited_at"] >= self.stream_edit_interval:
+            await self._show_stream(stream)
+
+    async def _show_stream(self, stream: Dict[str, Any]):
+        if not stream["text"].strip() or stream["text"] == stream["shown"]:
+            return
+        params = {"chat_id": self.chat_id, "text": stream["text"]}
+        if stream["message_id"] is None:
+            url = self.send_url
+        else:
+            url = self.edit_url
+            params["message_id"] = stream["message_id"]
+        stream["edited_at"] = time.monotonic()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, params=params) as response:
+                response_json = await response.json()
+        if response_json["ok"]:
+            stream["shown"] = stream["text"]
+            if stream["message_id"] is None:
+                stream["message_id"] = response_json["result"]["message_id"]
+        else:
+            logger.warning(f"Could not show streamed response: {response_json}")
+
     async def _listen(
         self, message: Message, metadata: Optional[Dict[str, Any]] = None
     ):
@@ -67,6 +113,10 @@ class TelegramHuman(Human):
         When a message is addressed to this human, forward it to the Telegram user.
         """
         original_conversation_id = message.conversation_id
+        stream = self._streams.pop(original_conversation_id, None)
+        if stream is not None:
+            # Show the end of the streamed response held back by the throttling
+            await self._show_stream(stream)
         logger.debug(f"Original conversation id: {original_conversation_id}")
         conversation_state = State.from_dict(
             await self.state_manager.get_state(conversation_id=original_conversation_id)
@@ -81,6 +131,8 @@ class TelegramHuman(Human):
             ]
         )
         text = f"*Conversation History*\n\n{conv_history_str}\n\n"
+        if isinstance(message.data, dict) and message.data.get("status") == "rejected":
+            text += f"{self._escape_markdown(message.data['error'])}\n\n"
         logger.debug(f"Sending message to Telegram: {text}")
         response = await self._wait_for_response(text)
         return {"role": "user", "content": response}
@@ -1,11 +1,13 @@
 from abc import ABC, abstractmethod
 import json
 import asyncio
+import time
 from dataclasses import dataclass, asdict
-from typing import TypeVar, Dict, Any, List, Optional
+from typing import TypeVar, Dict, Any, List, Optional, Set, Tuple, Coroutine, Union
 from logging import getLogger, basicConfig, INFO
 from datetime import datetime
-from .queue_manager import QueueManager, ListenerMetadata
+from .queue_manager import QueueManager, ListenerMetadata, MailboxFull, PoolUnavailable
+from .cache import LRUCache
 from uuid import uuid4
 
 # Configure logging
@@ -23,6 +25,12 @@ class Message:
     accessed: bool
     conversation_id: Optional[str] = None
     needs_response: bool = False
+    # Identifies a request, e.g. a tool call, so its response can be tied to it
+    correlation_id: Optional[str] = None
+    # Correlation id of the request this message responds to
+    in_reply_to: Optional[str] = None
+    # Time (epoch seconds) after which the sender no longer waits for a response
+    deadline: Optional[float] = None
 
     def to_json(self):
         return json.dumps(asdict(self))
@@ -33,11 +41,32 @@ class Message:
 
 
 class Listener(ABC):
-    def __init__(self, queue_manager: QueueManager, metadata: ListenerMetadata):
+    def __init__(
+        self,
+        queue_manager: QueueManager,
+        metadata: ListenerMetadata,
+        max_concurrency: int = 1,
+        max_queued: Optional[int] = None,
+    ):
+        assert max_concurrency >= 1, "max_concurrency must be at least 1"
+        max_queued = max_queued or 16 * max_concurrency
+        assert max_queued >= max_concurrency, "max_queued must be >= max_concurrency"
         self.queue_manager = queue_manager
         self.listener_id = metadata.listener_id
         self.metadata = metadata
         self.listener_task = None
+        # Bounds the number of messages being processed at the same time
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # Bounds the number of messages taken from the mailbox and not yet done,
+        # including the ones waiting behind earlier messages of their conversation
+        self.max_queued = max_queued
+        self._intake = asyncio.Semaphore(max_queued)
+        self._in_flight: Set[asyncio.Task] = set()
+        # Last task scheduled for each conversation, used to keep them ordered
+        self._conversation_tails: Dict[str, asyncio.Task] = {}
+        # Connected listeners materialized per set of avoided listeners
+        self._connected_listeners = LRUCache(maxsize=64)
         logger.info(f"Listener initialized with id: {self.listener_id}")
 
     async def init_async(self):
@@ -80,73 +109,201 @@ class Listener(ABC):
         """Main asynchronous listening loop"""
         while True:
             try:
-                # Get message with timeout
-                json_message = await self.queue_manager.async_get_message(
-                    listener_id=self.listener_id, timeout=1
-                )
-                message = Message.from_json(json_message)
-
-                metadata = None
-                if message.conversation_id is None:
-                    # Since we are generating a new conv id, this originated from a human
-                    # add the listener id to the conversation metadata
-                    metadata = {"origin": message.listener_id}
-                    message.conversation_id = self._generate_conversation_id()
-                    logger.debug(
-                        f"Generated conversation id: {message.conversation_id}"
-                    )
-
-                if not message.accessed and message.target_listener == self.listener_id:
-                    logger.debug(f"Received message by {self.listener_id}: {message}")
-
-                    # Process message using the subclass implementation
-                    output_data = await self._listen(message, metadata=metadata)
-                    logger.debug(f"Output data: {output_data}")
-                    if (
-                        isinstance(output_data, dict)
-                        and output_data.get("status") == "tool_call"
-                    ):
-                        # The agent is waiting for a response from the tool
-                        continue
-
-                    if isinstance(output_data, dict) and output_data.get("override"):
-                        target_listener = output_data["override"]
-                        message.needs_response = True
-                    else:
-                        target_listener = message.listener_id
-
-                    # Update activity
-                    await self.queue_manager.async_update_listener_activity(
-                        self.listener_id
-                    )
-
-                    # Handle response if needed
-                    if message.needs_response or self.metadata.listener_type == "human":
-                        needs_response = self.metadata.listener_type == "human"
-                        output_message = Message(
-                            listener_id=self.listener_id,
-                            data=output_data,
-                            target_listener=target_listener,
-                            accessed=False,
-                            conversation_id=message.conversation_id,
-                            needs_response=needs_response,
+                # Leave further messages in the mailbox while enough are queued
+                await self._intake.acquire()
+                try:
+                    # Block until a message is delivered to our mailbox
+                    delivery_id, json_message = (
+                        await self.queue_manager.async_get_message(
+                            listener_id=self.listener_id
                         )
-                        await self._send(output_message)
-
-            except asyncio.TimeoutError:
-                await asyncio.sleep(0.1)
+                    )
+                except BaseException:
+                    self._intake.release()
+                    raise
+                self._dispatch(delivery_id, json_message)
             except asyncio.CancelledError:
                 logger.info(f"Listener {self.listener_id} task cancelled")
+                for task in list(self._in_flight):
+                    task.cancel()
                 break
             except Exception as e:
-                logger.error(f"Unexpected error while processing message: {str(e)}")
+                logger.error(f"Unexpected error while receiving message: {str(e)}")
                 await asyncio.sleep(0.1)  # Prevent tight loop on repeated errors
 
-    async def _send(self, data: Message):
+    def _dispatch(self, delivery_id: str, json_message: str):
+        """
+        Schedule a message for processing. Messages of the same conversation
+        are chained so they run in the order they were received, while
+        different conversations run concurrently.
+        """
+        try:
+            message = Message.from_json(json_message)
+        except Exception as e:
+            message = None
+            logger.error(f"Could not parse message {json_message}: {str(e)}")
+
+        conversation_id = message.conversation_id if message else None
+        task = self._schedule_in_conversation(
+            conversation_id, self._process(delivery_id, message)
+        )
+        task.add_done_callback(lambda _: self._intake.release())
+
+    def _schedule_in_conversation(
+        self, conversation_id: Optional[str], coro: Coroutine
+    ) -> asyncio.Task:
+        """
+        Run a coroutine once the work already scheduled for the conversation
+        is done. Work scheduled later for the conversation waits for it in turn.
+        """
+        previous = self._conversation_tails.get(conversation_id)
+        task = asyncio.create_task(self._run_after(previous, coro))
+        self._in_flight.add(task)
+        if conversation_id is not None:
+            self._conversation_tails[conversation_id] = task
+
+        def _on_done(task: asyncio.Task):
+            self._in_flight.discard(task)
+            if self._conversation_tails.get(conversation_id) is task:
+                del self._conversation_tails[conversation_id]
+
+        task.add_done_callback(_on_done)
+        return task
+
+    @staticmethod
+    async def _run_after(previous: Optional[asyncio.Task], coro: Coroutine):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+        except asyncio.CancelledError:
+            coro.close()
+            raise
+        return await coro
+
+    async def _process(self, delivery_id: str, message: Optional[Message]):
+        """Process a message and acknowledge it"""
+        # Runs once the earlier messages of the conversation are done, so a slot
+        # is only held by a message that can make progress
+        async with self._slots:
+            if message is not None:
+                try:
+                    await self._handle_message(message)
+                except Exception as e:
+                    logger.error(f"Unexpected error while processing message: {str(e)}")
+            # Failed messages are acked as well so they are not redelivered forever
+            await self.queue_manager.async_ack_message(self.listener_id, delivery_id)
+
+    async def _handle_message(self, message: Message):
+        """Process a single message and send a response if one is needed"""
+        metadata = None
+        if message.conversation_id is None:
+            # Since we are generating a new conv id, this originated from a human
+            # add the listener id to the conversation metadata
+            metadata = {"origin": message.listener_id}
+            message.conversation_id = self._generate_conversation_id()
+            logger.debug(f"Generated conversation id: {message.conversation_id}")
+
+        # Messages can be addressed to this listener or to the pool it belongs to
+        if not message.accessed and message.target_listener in (
+            self.listener_id,
+            self.metadata.address,
+        ):
+            logger.debug(f"Received message by {self.listener_id}: {message}")
+
+            if isinstance(message.data, dict) and message.data.get("status") == "chunk":
+                # Partial text of a response that is still being generated
+                await self._on_chunk(message)
+                return
+
+            # Process message using the subclass implementation
+            if message.deadline is None:
+                output_data = await self._listen(message, metadata=metadata)
+            else:
+                output_data = await self._listen_before_deadline(message, metadata)
+            logger.debug(f"Output data: {output_data}")
+            if (
+                isinstance(output_data, dict)
+                and output_data.get("status") == "tool_call"
+            ):
+                # The agent is waiting for a response from the tool
+                return
+
+            if isinstance(output_data, dict) and output_data.get("override"):
+                target_listener = output_data["override"]
+                message.needs_response = True
+                in_reply_to = output_data.get("in_reply_to")
+            else:
+                target_listener = message.listener_id
+                in_reply_to = message.correlation_id
+
+            # Update activity
+            await self.queue_manager.async_update_listener_activity(self.listener_id)
+
+            # Handle response if needed
+            if message.needs_response or self.metadata.listener_type == "human":
+                needs_response = self.metadata.listener_type == "human"
+                output_message = Message(
+                    listener_id=self.listener_id,
+                    data=output_data,
+                    target_listener=target_listener,
+                    accessed=False,
+                    conversation_id=message.conversation_id,
+                    needs_response=needs_response,
+                    in_reply_to=in_reply_to,
+                )
+                try:
+                    await self._send(output_message)
+                except (MailboxFull, PoolUnavailable) as e:
+                    await self._on_rejected(output_message, e)
+
+    async def _listen_before_deadline(
+        self, message: Message, metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process a message unless its deadline has passed, and cancel the
+        processing when the deadline passes. The sender gets a timeout result.
+        """
+        remaining = message.deadline - time.time()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            return await asyncio.wait_for(
+                self._listen(message, metadata=metadata), timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.listener_id} missed the deadline of {message}")
+            return {
+                "status": "timeout",
+                "error": f"{self.metadata.listener_name} did not respond in time",
+            }
+
+    async def _on_chunk(self, message: Message):
+        """
+        Handle a chunk of a streamed response, its text is in message.data["text"].
+        The complete response follows as a regular message, so listeners that
+        do not render partial responses can ignore chunks.
+        """
+        pass
+
+    async def _on_rejected(
+        self, message: Message, error: Union[MailboxFull, PoolUnavailable]
+    ):
+        """
+        Handle an output message its target could not take. The message is
+        dropped, listeners that can act on it, e.g. by retrying, override this.
+        """
+        logger.warning(f"{self.listener_id} could not send {message}: {str(error)}")
+
+    async def _send(self, data: Message, overflow_policy: Optional[str] = None):
         """Asynchronous message sending"""
         json_data = data.to_json()
         logger.debug(f"Sending data: {json_data}")
-        await self.queue_manager.async_put_message(json_data)
+        await self.queue_manager.async_put_message(
+            json_data,
+            target_listener=data.target_listener,
+            reply=data.in_reply_to is not None,
+            overflow_policy=overflow_policy,
+        )
 
     async def stop(self):
         """Stop the listener"""
@@ -156,22 +313,47 @@ class Listener(ABC):
                 await self.listener_task
             except asyncio.CancelledError:
                 pass
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
         await self.queue_manager.async_detach_listener(self.listener_id)
         logger.info(f"Listener {self.listener_id} stopped")
 
     async def get_connected_listeners(
         self, others: bool = True, avoid_listeners: Optional[List[str]] = None
     ) -> List[ListenerMetadata]:
-        """Get all connected listeners"""
-        listeners = await self.queue_manager.async_get_all_listeners(status="active")
-        avoid_listeners = avoid_listeners or []
+        """Get all connected listeners, with a single entry per listener pool"""
+        _, connected = await self._get_connected_listeners_snapshot(
+            others=others, avoid_listeners=avoid_listeners
+        )
+        return connected
+
+    async def _get_connected_listeners_snapshot(
+        self, others: bool = True, avoid_listeners: Optional[List[str]] = None
+    ) -> Tuple[Tuple[int, Tuple[str, ...]], List[ListenerMetadata]]:
+        """
+        Get the connected listeners along with a key identifying them, made of
+        the registry version and the avoided listeners. The list is reused
+        until the registry version changes and must not be modified.
+        """
+        avoid = set(avoid_listeners or [])
         if others:
-            avoid_listeners.append(self.listener_id)
-        return [
-            ListenerMetadata(**listener)
-            for listener in listeners
-            if listener["listener_id"] not in avoid_listeners
-        ]
+            avoid.add(self.listener_id)
+        avoid_key = tuple(sorted(avoid))
+
+        version, listeners = await self.queue_manager.async_get_registry_snapshot()
+        cached = self._connected_listeners.get(avoid_key)
+        if cached is not None and cached[0] == version:
+            return (version, avoid_key), cached[1]
+
+        connected = {}
+        for listener in listeners:
+            if listener["listener_id"] in avoid:
+                continue
+            metadata = ListenerMetadata(**listener)
+            connected.setdefault(metadata.address, metadata)
+        connected = list(connected.values())
+        self._connected_listeners.set(avoid_key, (version, connected))
+        return (version, avoid_key), connected
 
     def _generate_listener_id(self, prefix: str = "listener") -> str:
         return f"{prefix}-{uuid4().hex[:6]}"
@@ -0,0 +1,4 @@
+from .factory import MessageBusFactory
+from .base_bus import MessageBus
+from .memory_bus import MemoryMessageBus
+from .redis_bus import RedisMessageBus
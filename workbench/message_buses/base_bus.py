@@ -0,0 +1,94 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Optional, Tuple
+
+
+class MessageBus(ABC):
+    """
+    Transport that delivers serialized messages into per-listener mailboxes.
+    """
+
+    @abstractmethod
+    async def create_mailbox(self, listener_id: str) -> None:
+        """
+        Make sure a mailbox exists for the listener.
+        """
+        pass
+
+    @abstractmethod
+    async def delete_mailbox(self, listener_id: str) -> None:
+        """
+        Remove the mailbox of the listener along with any undelivered messages.
+        """
+        pass
+
+    @abstractmethod
+    async def publish(self, target_listener: str, message_json: str) -> None:
+        """
+        Deliver a message into the mailbox of the target listener.
+        """
+        pass
+
+    @abstractmethod
+    async def consume(
+        self, listener_id: str, timeout: Optional[float] = None
+    ) -> Tuple[str, str]:
+        """
+        Block until a message is available and return its delivery id and JSON.
+        Raises asyncio.TimeoutError if a timeout is given and expires.
+        """
+        pass
+
+    @abstractmethod
+    async def ack(self, listener_id: str, delivery_id: str) -> None:
+        """
+        Acknowledge that a consumed message has been processed.
+        """
+        pass
+
+    @abstractmethod
+    async def mailbox_size(self, listener_id: str) -> int:
+        """
+        Number of messages in the mailbox of the listener that have not been
+        acknowledged yet, including those being processed.
+        """
+        pass
+
+    @abstractmethod
+    async def drop_oldest(
+        self, listener_id: str, keep: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        """
+        Remove the oldest message of the mailbox that has not been consumed yet,
+        skipping those keep returns True for, and return its JSON, or None if
+        there is none.
+        """
+        pass
+
+    @abstractmethod
+    async def spill(self, listener_id: str, message_json: str) -> None:
+        """
+        Set a message aside, outside of the mailbox of the listener, until
+        there is room for it.
+        """
+        pass
+
+    @abstractmethod
+    async def pop_spilled(self, listener_id: str) -> Optional[str]:
+        """
+        Remove and return the oldest message set aside for the listener, or
+        None if there is none.
+        """
+        pass
+
+    @abstractmethod
+    async def spilled_size(self, listener_id: str) -> int:
+        """
+        Number of messages set aside for the listener.
+        """
+        pass
+
+    async def close(self) -> None:
+        """
+        Release any resources held by the bus.
+        """
+        pass
@@ -0,0 +1,13 @@
+from .base_bus import MessageBus
+import importlib
+from typing import Literal
+
+
+class MessageBusFactory:
+    @staticmethod
+    def create_message_bus(
+        bus_type: Literal["memory", "redis"], **kwargs
+    ) -> MessageBus:
+        module = importlib.import_module(f".{bus_type}_bus", package=__package__)
+        cls_ = getattr(module, f"{bus_type.capitalize()}MessageBus")
+        return cls_(**kwargs)
@@ -0,0 +1,80 @@
+from .base_bus import MessageBus
+from asyncio import Queue
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+from itertools import count
+import asyncio
+
+
+class MemoryMessageBus(MessageBus):
+    """
+    In-process bus with one asyncio queue per listener.
+    Messages are handed over as soon as they are put, so acks only count
+    the messages still being processed.
+    """
+
+    def __init__(self):
+        self.mailboxes: Dict[str, Queue] = {}
+        self._delivery_ids = count(1)
+        # Messages consumed from each mailbox and not acknowledged yet
+        self._unacked: Dict[str, int] = {}
+        # Messages set aside until their mailbox has room
+        self._spilled: Dict[str, Deque[str]] = {}
+
+    def _get_mailbox(self, listener_id: str) -> Queue:
+        # Created on first use so that messages sent before the listener
+        # attaches are not lost
+        mailbox = self.mailboxes.get(listener_id)
+        if mailbox is None:
+            mailbox = self.mailboxes[listener_id] = Queue()
+        return mailbox
+
+    async def create_mailbox(self, listener_id: str) -> None:
+        self._get_mailbox(listener_id)
+
+    async def delete_mailbox(self, listener_id: str) -> None:
+        self.mailboxes.pop(listener_id, None)
+        self._unacked.pop(listener_id, None)
+        self._spilled.pop(listener_id, None)
+
+    async def publish(self, target_listener: str, message_json: str) -> None:
+        await self._get_mailbox(target_listener).put(message_json)
+
+    async def consume(
+        self, listener_id: str, timeout: Optional[float] = None
+    ) -> Tuple[str, str]:
+        message_json = await asyncio.wait_for(
+            self._get_mailbox(listener_id).get(), timeout=timeout
+        )
+        self._unacked[listener_id] = self._unacked.get(listener_id, 0) + 1
+        return str(next(self._delivery_ids)), message_json
+
+    async def ack(self, listener_id: str, delivery_id: str) -> None:
+        if self._unacked.get(listener_id):
+            self._unacked[listener_id] -= 1
+
+    async def mailbox_size(self, listener_id: str) -> int:
+        return self._get_mailbox(listener_id).qsize() + self._unacked.get(
+            listener_id, 0
+        )
+
+    async def drop_oldest(
+        self, listener_id: str, keep: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        # The deque behind the queue, messages are removed from it in place
+        queued = self._get_mailbox(listener_id)._queue
+        for message_json in queued:
+            if keep is None or not keep(message_json):
+                queued.remove(message_json)
+                return message_json
+        return None
+
+    async def spill(self, listener_id: str, message_json: str) -> None:
+        self._spilled.setdefault(listener_id, deque()).append(message_json)
+
+    async def pop_spilled(self, listener_id: str) -> Optional[str]:
+        spilled = self._spilled.get(listener_id)
+        return spilled.popleft() if spilled else None
+
+    async def spilled_size(self, listener_id: str) -> int:
+        return len(self._spilled.get(listener_id, ()))
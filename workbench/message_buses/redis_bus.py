@@ -0,0 +1,224 @@
+from .base_bus import MessageBus
+from ..cache import REDIS
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from typing import Callable, Dict, Deque, Optional, Set, Tuple
+from collections import deque
+from logging import getLogger
+import asyncio
+import os
+import socket
+import time
+
+logger = getLogger(__name__)
+
+
+class RedisMessageBus(MessageBus):
+    """
+    Distributed bus backed by Redis Streams.
+
+    Every listener gets its own stream, read through a consumer group so that
+    a message stays pending until it is acked. Acked entries are deleted, which
+    keeps the length of a stream equal to its backlog.
+
+    The first time a listener consumes, the entries still pending for this
+    consumer are delivered again, which recovers them after a restart when the
+    consumer name is stable. Entries pending for other consumers for longer
+    than claim_idle_ms are claimed every claim_interval seconds, so
+    claim_idle_ms must exceed the longest time a message takes to handle.
+    """
+
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        stream_prefix: str = "workbench:mailbox",
+        group_name: str = "workbench",
+        consumer_name: Optional[str] = None,
+        claim_idle_ms: int = 60000,
+        claim_interval: float = 10.0,
+        spill_prefix: str = "workbench:spill",
+    ):
+        self.redis = redis or REDIS
+        self.stream_prefix = stream_prefix
+        self.group_name = group_name
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        # Messages set aside until their mailbox has room live in Redis lists
+        self.spill_prefix = spill_prefix
+        self._groups: Set[str] = set()
+        self._recovered: Set[str] = set()
+        # Recovered or claimed entries not yet handed out, per stream
+        self._backlog: Dict[str, Deque[Tuple[str, str]]] = {}
+        self._next_claim: Dict[str, float] = {}
+
+    def _stream_key(self, listener_id: str) -> str:
+        return f"{self.stream_prefix}:{listener_id}"
+
+    def _spill_key(self, listener_id: str) -> str:
+        return f"{self.spill_prefix}:{listener_id}"
+
+    async def _ensure_group(self, listener_id: str) -> str:
+        stream_key = self._stream_key(listener_id)
+        if stream_key not in self._groups:
+            try:
+                # Start from the beginning of the stream so that messages
+                # published before the group existed are still delivered
+                await self.redis.xgroup_create(
+                    stream_key, self.group_name, id="0", mkstream=True
+                )
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._groups.add(stream_key)
+        return stream_key
+
+    async def create_mailbox(self, listener_id: str) -> None:
+        await self._ensure_group(listener_id)
+
+    async def delete_mailbox(self, listener_id: str) -> None:
+        stream_key = self._stream_key(listener_id)
+        await self.redis.delete(stream_key, self._spill_key(listener_id))
+        self._groups.discard(stream_key)
+        self._recovered.discard(stream_key)
+        self._backlog.pop(stream_key, None)
+        self._next_claim.pop(stream_key, None)
+
+    async def publish(self, target_listener: str, message_json: str) -> None:
+        await self.redis.xadd(
+            self._stream_key(target_listener), {"message": message_json}
+        )
+
+    async def _recover_own(self, stream_key: str) -> None:
+        """Queue the entries left pending for this consumer, e.g. before a restart"""
+        response = await self.redis.xreadgroup(
+            self.group_name, self.consumer_name, {stream_key: "0"}
+        )
+        entries = response[0][1] if response else []
+        backlog = self._backlog.setdefault(stream_key, deque())
+        for delivery_id, fields in entries:
+            if not fields:
+                # Deleted while pending, nothing left to deliver
+                await self.redis.xack(stream_key, self.group_name, delivery_id)
+                continue
+            backlog.append((delivery_id, fields["message"]))
+        if backlog:
+            logger.info(f"Recovered {len(backlog)} pending messages from {stream_key}")
+        self._recovered.add(stream_key)
+
+    async def _claim_stale(self, stream_key: str) -> None:
+        """Queue the entries left pending too long by other consumers"""
+        self._next_claim[stream_key] = time.monotonic() + self.claim_interval
+        pending = await self.redis.xpending_range(
+            stream_key,
+            self.group_name,
+            min="-",
+            max="+",
+            count=100,
+            idle=self.claim_idle_ms,
+        )
+        stale = [
+            entry["message_id"]
+            for entry in pending
+            if entry["consumer"] != self.consumer_name
+        ]
+        if not stale:
+            return
+        claimed = await self.redis.xclaim(
+            stream_key,
+            self.group_name,
+            self.consumer_name,
+            min_idle_time=self.claim_idle_ms,
+            message_ids=stale,
+        )
+        backlog = self._backlog.setdefault(stream_key, deque())
+        for delivery_id, fields in claimed:
+            if not fields:
+                await self.redis.xack(stream_key, self.group_name, delivery_id)
+                continue
+            logger.info(f"Claimed stale message {delivery_id} from {stream_key}")
+            backlog.append((delivery_id, fields["message"]))
+
+    async def consume(
+        self, listener_id: str, timeout: Optional[float] = None
+    ) -> Tuple[str, str]:
+        stream_key = await self._ensure_group(listener_id)
+        if stream_key not in self._recovered:
+            await self._recover_own(stream_key)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if time.monotonic() >= self._next_claim.get(stream_key, 0):
+                await self._claim_stale(stream_key)
+            backlog = self._backlog.get(stream_key)
+            if backlog:
+                return backlog.popleft()
+
+            # Block until the next claim at the latest
+            wait = self._next_claim[stream_key] - time.monotonic()
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+            try:
+                response = await self.redis.xreadgroup(
+                    self.group_name,
+                    self.consumer_name,
+                    {stream_key: ">"},
+                    count=1,
+                    block=max(int(wait * 1000), 1),
+                )
+            except ResponseError as e:
+                if "NOGROUP" not in str(e):
+                    raise
+                # The stream was deleted underneath us, recreate it
+                self._groups.discard(stream_key)
+                await self._ensure_group(listener_id)
+                continue
+            if response:
+                _, entries = response[0]
+                delivery_id, fields = entries[0]
+                return delivery_id, fields["message"]
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError
+
+    async def mailbox_size(self, listener_id: str) -> int:
+        # Acked entries are deleted, so the stream holds exactly the unacked ones
+        return await self.redis.xlen(self._stream_key(listener_id))
+
+    async def drop_oldest(
+        self, listener_id: str, keep: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        stream_key = self._stream_key(listener_id)
+        # Entries after the last one delivered to the group are not consumed yet
+        start = "-"
+        try:
+            groups = await self.redis.xinfo_groups(stream_key)
+        except ResponseError:
+            # The stream does not exist
+            return None
+        for group in groups:
+            if group["name"] == self.group_name:
+                start = f"({group['last-delivered-id']}"
+        while True:
+            entries = await self.redis.xrange(stream_key, min=start, max="+", count=100)
+            if not entries:
+                return None
+            for delivery_id, fields in entries:
+                if keep is None or not keep(fields["message"]):
+                    await self.redis.xdel(stream_key, delivery_id)
+                    return fields["message"]
+            start = f"({entries[-1][0]}"
+
+    async def spill(self, listener_id: str, message_json: str) -> None:
+        await self.redis.rpush(self._spill_key(listener_id), message_json)
+
+    async def pop_spilled(self, listener_id: str) -> Optional[str]:
+        return await self.redis.lpop(self._spill_key(listener_id))
+
+    async def spilled_size(self, listener_id: str) -> int:
+        return await self.redis.llen(self._spill_key(listener_id))
+
+    async def ack(self, listener_id: str, delivery_id: str) -> None:
+        stream_key = self._stream_key(listener_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(stream_key, self.group_name, delivery_id)
+            pipe.xdel(stream_key, delivery_id)
+            await pipe.execute()
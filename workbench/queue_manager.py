@@ -1,16 +1,39 @@
 from dataclasses import dataclass, asdict, field
-from typing import Dict, Any, List, Optional, Literal
+from typing import Dict, Any, List, Optional, Literal, Set, Tuple
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
-from asyncio import Queue
 from logging import getLogger
-from .cache import REDIS
+from .cache import REDIS, LRUCache
+from .message_buses import MessageBus, MemoryMessageBus
 import asyncio
 import json
-from pymongo import ReturnDocument
+import time
+from pymongo import ReturnDocument, UpdateOne
 
 logger = getLogger(__name__)
 
+# Redis pub/sub channel announcing changes to the listener registry
+LISTENER_EVENTS_CHANNEL = "workbench:listener_events"
+
+
+class MailboxFull(Exception):
+    """Raised when a message cannot be put in the mailbox of a listener at capacity"""
+
+    def __init__(self, listener_id: str, retry_after: float):
+        super().__init__(
+            f"Mailbox of {listener_id} is full, retry after {retry_after} seconds"
+        )
+        self.listener_id = listener_id
+        self.retry_after = retry_after
+
+
+class PoolUnavailable(Exception):
+    """Raised when a message is addressed to a listener pool without active replicas"""
+
+    def __init__(self, pool_name: str):
+        super().__init__(f"No active replicas in the listener pool {pool_name}")
+        self.pool_name = pool_name
+
 
 @dataclass
 class ListenerMetadata:
@@ -24,6 +47,13 @@ class ListenerMetadata:
     description: str = ""
     input_schema: Dict[str, Any] = field(default_factory=dict)
     output_schema: Dict[str, Any] = field(default_factory=dict)
+    # Pooled listeners are replicas addressed together by their listener_name
+    pooled: bool = False
+
+    @property
+    def address(self) -> str:
+        """The id other listeners should send messages to"""
+        return self.listener_name if self.pooled else self.listener_id
 
     def to_dict(self):
         return {
@@ -37,6 +67,7 @@ class ListenerMetadata:
             "description": self.description,
             "input_schema": self.input_schema,
             "output_schema": self.output_schema,
+            "pooled": self.pooled,
         }
 
     def to_json(self) -> str:
@@ -66,9 +97,64 @@ class ActiveListenerData:
 
 
 class QueueManager:
-    def __init__(self):
-        # Async message queue for communication between listeners
-        self.message_queue = Queue()
+    def __init__(
+        self,
+        message_bus: Optional[MessageBus] = None,
+        pool_strategy: Literal["round_robin", "least_outstanding"] = "round_robin",
+        activity_flush_interval: float = 5.0,
+        metadata_cache_size: int = 1024,
+        metadata_cache_ttl: Optional[float] = 300,
+        registry_snapshot_ttl: Optional[float] = 60,
+        mailbox_capacity: Optional[int] = None,
+        mailbox_capacities: Optional[Dict[str, int]] = None,
+        overflow_policy: Literal["block", "reject", "drop_oldest", "spill"] = "block",
+        block_timeout: Optional[float] = 30.0,
+        retry_after: float = 1.0,
+    ):
+        # Bus delivering messages into one mailbox per listener
+        self.message_bus = message_bus or MemoryMessageBus()
+        # Replica ids of each listener pool, keyed by the pool's listener name,
+        # built from the registry snapshot so replicas of every process are known
+        self.pools: Dict[str, List[str]] = {}
+        self._pools_version = -1
+        # Every pool name seen in this process, by attaching a replica or in a
+        # registry snapshot. Only these targets are looked up in the registry
+        self._pool_names: Set[str] = set()
+        self.pool_strategy = pool_strategy
+        self._pool_cursors: Dict[str, int] = {}
+        # Listener activity buffered until the next flush to the DB,
+        # activity within the last interval is lost if the process crashes
+        self.activity_flush_interval = activity_flush_interval
+        self._pending_usage: Dict[str, int] = {}
+        self._pending_last_active: Dict[str, datetime] = {}
+        self._activity_flush_task: Optional[asyncio.Task] = None
+        # Flush started by the loop, left to finish when the loop is cancelled
+        self._activity_flush: Optional[asyncio.Future] = None
+        # Local copy of listener metadata, invalidated through Redis pub/sub
+        self.metadata_cache = LRUCache(
+            maxsize=metadata_cache_size, ttl=metadata_cache_ttl
+        )
+        self._listener_events_task: Optional[asyncio.Task] = None
+        # Snapshot of the active listeners, refreshed whenever a listener event
+        # bumps the registry version or the snapshot is older than its TTL
+        self.registry_version = 0
+        self.registry_snapshot_ttl = registry_snapshot_ttl
+        self._registry_snapshot: Optional[List[Dict[str, Any]]] = None
+        self._registry_snapshot_version = -1
+        self._registry_snapshot_at = 0.0
+        # Unacknowledged messages each mailbox holds at most, by listener id or
+        # pool name, and what happens to messages put in a full mailbox:
+        # block the sender (for up to block_timeout seconds), reject them,
+        # drop the oldest message or spill them to the bus until there is room.
+        # Replies are not held to the capacity nor dropped: the target is waiting
+        # for them, and two listeners blocked on each other's mailboxes would deadlock
+        self.mailbox_capacity = mailbox_capacity
+        self.mailbox_capacities = mailbox_capacities or {}
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.retry_after = retry_after
+        self._space_freed: Dict[str, asyncio.Event] = {}
+        self.overflow_stats = {"blocked": 0, "rejected": 0, "dropped": 0, "spilled": 0}
         # Dictionary to track active listeners
         self.active_listeners = {}
         # MongoDB async connection for persistent storage
@@ -81,6 +167,79 @@ class QueueManager:
     def _cache_key(self, listener_id: str) -> str:
         return f"listener_{listener_id}"
 
+    async def _get_pools(self) -> Dict[str, List[str]]:
+        version, listeners = await self.async_get_registry_snapshot()
+        if version != self._pools_version:
+            pools: Dict[str, List[str]] = {}
+            for listener in listeners:
+                if listener.get("pooled"):
+                    pools.setdefault(listener["listener_name"], []).append(
+                        listener["listener_id"]
+                    )
+            self.pools = pools
+            self._pools_version = version
+        return self.pools
+
+    async def _resolve_target(self, target_listener: str) -> str:
+        """
+        Pick the replica that should receive a message addressed to a pool,
+        raises PoolUnavailable if the pool has no active replica left.
+        Targets that are not pools are returned unchanged.
+        """
+        if target_listener not in self._pool_names:
+            # A listener id, sent straight to its mailbox
+            return target_listener
+        replicas = (await self._get_pools()).get(target_listener)
+        if not replicas:
+            raise PoolUnavailable(target_listener)
+        if self.pool_strategy == "least_outstanding":
+            # Mailbox sizes count the messages queued or being processed,
+            # whichever process sent them
+            sizes = await asyncio.gather(
+                *[self.message_bus.mailbox_size(replica) for replica in replicas]
+            )
+            return replicas[sizes.index(min(sizes))]
+        cursor = self._pool_cursors.get(target_listener, 0) % len(replicas)
+        self._pool_cursors[target_listener] = cursor + 1
+        return replicas[cursor]
+
+    def _ensure_listener_events_subscription(self):
+        if self._listener_events_task is None or self._listener_events_task.done():
+            self._listener_events_task = asyncio.create_task(
+                self._listen_for_listener_events()
+            )
+
+    async def _listen_for_listener_events(self):
+        """
+        Drop cached metadata of listeners that were attached, detached or
+        updated, possibly by another process
+        """
+        pubsub = REDIS.pubsub()
+        try:
+            await pubsub.subscribe(LISTENER_EVENTS_CHANNEL)
+            async for event in pubsub.listen():
+                if event["type"] != "message":
+                    continue
+                listener_event = json.loads(event["data"])
+                self.metadata_cache.delete(listener_event["listener_id"])
+                self.registry_version += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stopped listening for listener events: {str(e)}")
+        finally:
+            await pubsub.aclose()
+
+    async def _publish_listener_event(
+        self, event: Literal["attach", "detach", "update"], listener_id: str
+    ):
+        self.metadata_cache.delete(listener_id)
+        self.registry_version += 1
+        await REDIS.publish(
+            LISTENER_EVENTS_CHANNEL,
+            json.dumps({"event": event, "listener_id": listener_id}),
+        )
+
     async def attach_listener(
         self, listener_id: str, metadata: ListenerMetadata
     ) -> Dict[str, Any]:
@@ -96,11 +255,17 @@ class QueueManager:
             return_document=ReturnDocument.AFTER,
         )
 
+        event = "update" if listener_id in self.active_listeners else "attach"
         # Add to active listeners dictionary
         self.active_listeners[listener_id] = metadata
+        await self.message_bus.create_mailbox(listener_id)
+        if metadata.pooled:
+            self._pool_names.add(metadata.listener_name)
 
         # Cache the result
         await REDIS.set(self._cache_key(listener_id), metadata.to_json(), ex=3600)
+        self._ensure_listener_events_subscription()
+        await self._publish_listener_event(event, listener_id)
 
         logger.info(f"Listener {listener_id} attached")
         return {"listener_id": listener_id, "metadata": metadata_dict}
@@ -110,8 +275,9 @@ class QueueManager:
         Remove a listener from the queue manager
         """
         # Remove from active listeners dictionary
-        if listener_id in self.active_listeners:
-            del self.active_listeners[listener_id]
+        self.active_listeners.pop(listener_id, None)
+        # Drop any undelivered mail for the listener
+        await self.message_bus.delete_mailbox(listener_id)
 
         # Remove from Redis cache
         await REDIS.delete(self._cache_key(listener_id))
@@ -120,46 +286,166 @@ class QueueManager:
         await self.listeners_collection.update_one(
             {"listener_id": listener_id}, {"$set": {"status": "inactive"}}
         )
+        await self._publish_listener_event("detach", listener_id)
 
         logger.info(f"Listener {listener_id} detached")
 
-    async def async_put_message(self, message_json: str):
+    async def async_put_message(
+        self,
+        message_json: str,
+        target_listener: Optional[str] = None,
+        reply: bool = False,
+        overflow_policy: Optional[Literal["block", "reject", "drop_oldest"]] = None,
+    ):
         """
-        Put a message into the queue
+        Route a message straight into the mailbox of its target listener.
+        Messages addressed to a pool go to one of its replicas, PoolUnavailable
+        is raised if it has none. The target is only parsed out of the message
+        if not given. Replies skip the mailbox capacity check, and overflow_policy
+        overrides the one of the queue manager for this message. Spilling is
+        only set for the whole queue manager, it refills mailboxes on acks.
         """
-        await self.message_queue.put(message_json)
-
-    async def async_get_message(self, listener_id: str, timeout: float = 1) -> str:
+        if target_listener is None:
+            target_listener = json.loads(message_json)["target_listener"]
+        capacity = self.mailbox_capacities.get(target_listener, self.mailbox_capacity)
+        target_listener = await self._resolve_target(target_listener)
+        capacity = self.mailbox_capacities.get(target_listener, capacity)
+        if (
+            capacity is not None
+            and not reply
+            and not await self._make_room(
+                target_listener,
+                message_json,
+                capacity,
+                overflow_policy or self.overflow_policy,
+            )
+        ):
+            # Spilled, published once the mailbox has room
+            return
+        await self.message_bus.publish(target_listener, message_json)
+
+    def _capacity(self, listener_id: str) -> Optional[int]:
+        """Capacity of the mailbox of a listener, or of the pool it belongs to"""
+        capacity = self.mailbox_capacities.get(listener_id)
+        metadata = self.active_listeners.get(listener_id)
+        if capacity is None and metadata is not None and metadata.pooled:
+            capacity = self.mailbox_capacities.get(metadata.listener_name)
+        return capacity if capacity is not None else self.mailbox_capacity
+
+    @staticmethod
+    def _is_reply(message_json: str) -> bool:
+        return json.loads(message_json).get("in_reply_to") is not None
+
+    async def _make_room(
+        self, listener_id: str, message_json: str, capacity: int, overflow_policy: str
+    ) -> bool:
         """
-        Only return a message if it is for the intended listener.
+        Apply the overflow policy if the mailbox is full. Returns False if the
+        message was spilled instead, raises MailboxFull if it is rejected.
         """
-        while True:
+        if overflow_policy == "spill":
+            size = await self.message_bus.mailbox_size(listener_id)
+            # Once spilling, later messages queue behind the spilled ones
+            if (
+                size < capacity
+                and await self.message_bus.spilled_size(listener_id) == 0
+            ):
+                return True
+            self.overflow_stats["spilled"] += 1
+            await self.message_bus.spill(listener_id, message_json)
+            await self._refill(listener_id, capacity)
+            return False
+
+        if await self.message_bus.mailbox_size(listener_id) < capacity:
+            return True
+        if overflow_policy == "reject":
+            self.overflow_stats["rejected"] += 1
+            raise MailboxFull(listener_id, self.retry_after)
+        if overflow_policy == "drop_oldest":
+            while await self.message_bus.mailbox_size(listener_id) >= capacity:
+                if (
+                    await self.message_bus.drop_oldest(listener_id, keep=self._is_reply)
+                    is None
+                ):
+                    # Everything in the mailbox is a reply or being processed already
+                    break
+                self.overflow_stats["dropped"] += 1
+                logger.warning(f"Dropped the oldest message for {listener_id}")
+            return True
+
+        # Block until the listener acknowledges messages
+        self.overflow_stats["blocked"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = (
+            loop.time() + self.block_timeout if self.block_timeout is not None else None
+        )
+        space_freed = self._space_freed.setdefault(listener_id, asyncio.Event())
+        while await self.message_bus.mailbox_size(listener_id) >= capacity:
+            timeout = self.retry_after
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    self.overflow_stats["rejected"] += 1
+                    raise MailboxFull(listener_id, self.retry_after)
+            space_freed.clear()
+            # Acks in this process wake the sender up, others are polled for
             try:
-                message_json = await asyncio.wait_for(
-                    self.message_queue.get(), timeout=timeout
-                )
-                message = json.loads(message_json)
-                if message["target_listener"] == listener_id:
-                    return message_json
-                else:
-                    logger.debug(
-                        f"Skipping message {message} because it was not addressed to {listener_id}"
-                    )
-                    await self.async_put_message(message_json)
-                    await asyncio.sleep(0.1)  # Yield control before trying again
+                await asyncio.wait_for(space_freed.wait(), timeout=timeout)
             except asyncio.TimeoutError:
-                raise
+                pass
+        return True
+
+    async def async_get_message(
+        self, listener_id: str, timeout: Optional[float] = None
+    ) -> Tuple[str, str]:
+        """
+        Return the delivery id and JSON of the next message addressed to the
+        listener, blocking until one arrives in its mailbox. Without a timeout
+        this waits indefinitely, otherwise raises asyncio.TimeoutError when it
+        expires. The message must be acknowledged once it has been processed.
+        """
+        return await self.message_bus.consume(listener_id, timeout=timeout)
+
+    async def async_ack_message(self, listener_id: str, delivery_id: str):
+        """
+        Acknowledge a message returned by async_get_message
+        """
+        await self.message_bus.ack(listener_id, delivery_id)
+        space_freed = self._space_freed.get(listener_id)
+        if space_freed is not None:
+            space_freed.set()
+        if self.overflow_policy == "spill":
+            capacity = self._capacity(listener_id)
+            if capacity is not None:
+                # Move spilled messages into the room just made
+                await self._refill(listener_id, capacity)
+
+    async def _refill(self, listener_id: str, capacity: int):
+        """Publish spilled messages of a listener, oldest first, while there is room"""
+        room = capacity - await self.message_bus.mailbox_size(listener_id)
+        for _ in range(room):
+            spilled = await self.message_bus.pop_spilled(listener_id)
+            if spilled is None:
+                return
+            await self.message_bus.publish(listener_id, spilled)
 
     async def async_get_listener_metadata(
         self, listener_id: str
     ) -> Optional[Dict[str, Any]]:
         """
-        Fetch listener metadata from cache first, then DB
+        Fetch listener metadata from the local cache first, then Redis, then DB
         """
+        metadata = self.metadata_cache.get(listener_id)
+        if metadata is not None:
+            return metadata
+        self._ensure_listener_events_subscription()
+
         # Try cache first
         cached_data = await REDIS.get(self._cache_key(listener_id))
         if cached_data:
-            return json.loads(cached_data)
+            metadata = json.loads(cached_data)
+            self.metadata_cache.set(listener_id, metadata)
+            return metadata
 
         # If not in cache, get from DB
         metadata = await self.listeners_collection.find_one(
@@ -175,15 +461,51 @@ class QueueManager:
 
             # Cache the result
             await REDIS.set(self._cache_key(listener_id), json.dumps(metadata), ex=3600)
+            self.metadata_cache.set(listener_id, metadata)
             return metadata
         return None
 
+    async def async_get_registry_snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Return the registry version along with the active listeners it covers.
+        The list is shared between callers and must not be modified.
+        """
+        snapshot_age = time.monotonic() - self._registry_snapshot_at
+        if (
+            self.registry_snapshot_ttl is not None
+            and snapshot_age > self.registry_snapshot_ttl
+        ):
+            self.registry_version += 1
+        if self._registry_snapshot_version != self.registry_version:
+            self._ensure_listener_events_subscription()
+            # Tag the snapshot with the version it was requested at, so a
+            # listener event arriving during the query triggers another refresh
+            version = self.registry_version
+            snapshot = await self._async_find_listeners(status="active")
+            self._pool_names.update(
+                listener["listener_name"]
+                for listener in snapshot
+                if listener.get("pooled")
+            )
+            self._registry_snapshot = snapshot
+            self._registry_snapshot_version = version
+            self._registry_snapshot_at = time.monotonic()
+            return version, snapshot
+        return self._registry_snapshot_version, self._registry_snapshot
+
     async def async_get_all_listeners(
         self, status: str = "active"
     ) -> List[Dict[str, Any]]:
         """
-        Fetch all listeners with the given status
+        Fetch all listeners with the given status, active listeners are served
+        from the registry snapshot
         """
+        if status == "active":
+            _, listeners = await self.async_get_registry_snapshot()
+            return listeners
+        return await self._async_find_listeners(status=status)
+
+    async def _async_find_listeners(self, status: str) -> List[Dict[str, Any]]:
         cursor = self.listeners_collection.find(
             {"status": status}, projection={"_id": False}
         )
@@ -198,29 +520,86 @@ class QueueManager:
 
         return listeners
 
-    async def async_update_listener_activity(self, listener_id: str) -> Optional[dict]:
+    async def async_update_listener_activity(self, listener_id: str):
         """
-        Update last active timestamp for a listener and increment usage count
+        Record that a listener was active. Usage counts and last active
+        timestamps are buffered in memory and written to the DB in batches
+        every activity_flush_interval seconds.
         """
         now = datetime.now()
-        # Update DB
-        metadata = await self.listeners_collection.find_one_and_update(
-            {"listener_id": listener_id},
-            {"$set": {"last_active": now}, "$inc": {"usage": 1}},
-            projection={"_id": False},
-            return_document=ReturnDocument.AFTER,
-        )
+        self._pending_usage[listener_id] = self._pending_usage.get(listener_id, 0) + 1
+        self._pending_last_active[listener_id] = now
 
+        # Keep the local view of the listener up to date
+        metadata = self.active_listeners.get(listener_id)
         if metadata:
-            # Fix datetime serialization for cache
-            metadata["last_active"] = metadata["last_active"].isoformat()
-            metadata["created_at"] = metadata["created_at"].isoformat()
-            await REDIS.set(self._cache_key(listener_id), json.dumps(metadata), ex=3600)
-            return metadata
-        return None
+            metadata.usage += 1
+            metadata.last_active = now
+
+        if self._activity_flush_task is None or self._activity_flush_task.done():
+            self._activity_flush_task = asyncio.create_task(self._activity_flush_loop())
+
+    async def _activity_flush_loop(self):
+        """
+        Periodically flush the buffered listener activity
+        """
+        while True:
+            await asyncio.sleep(self.activity_flush_interval)
+            self._activity_flush = asyncio.ensure_future(
+                self.async_flush_listener_activity()
+            )
+            try:
+                # A batch cancelled in the middle of its write would be lost
+                await asyncio.shield(self._activity_flush)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to flush listener activity: {str(e)}")
+
+    async def async_flush_listener_activity(self):
+        """
+        Write the buffered listener activity to the DB in a single bulk write
+        """
+        if not self._pending_usage:
+            return
+        pending_usage, self._pending_usage = self._pending_usage, {}
+        pending_last_active, self._pending_last_active = self._pending_last_active, {}
+
+        operations = [
+            UpdateOne(
+                {"listener_id": listener_id},
+                {
+                    "$inc": {"usage": usage},
+                    "$max": {"last_active": pending_last_active[listener_id]},
+                },
+            )
+            for listener_id, usage in pending_usage.items()
+        ]
+        try:
+            await self.listeners_collection.bulk_write(operations, ordered=False)
+        except Exception:
+            # Put the activity back so it is retried with the next flush
+            for listener_id, usage in pending_usage.items():
+                self._pending_usage[listener_id] = (
+                    self._pending_usage.get(listener_id, 0) + usage
+                )
+                self._pending_last_active.setdefault(
+                    listener_id, pending_last_active[listener_id]
+                )
+            raise
+        logger.debug(f"Flushed activity of {len(operations)} listeners")
 
     async def close(self):
         """
         Clean up connections
         """
+        if self._activity_flush_task:
+            self._activity_flush_task.cancel()
+        if self._listener_events_task:
+            self._listener_events_task.cancel()
+        if self._activity_flush is not None:
+            # A failed write puts its batch back for the final flush
+            await asyncio.gather(self._activity_flush, return_exceptions=True)
+        await self.async_flush_listener_activity()
+        await self.message_bus.close()
         self.mongo_client.close()
@@ -1,10 +1,58 @@
 from ..listener import ListenerMetadata, Listener, Message
 from ..queue_manager import QueueManager
-from typing import Dict, Any, Optional
+from ..cache import REDIS, LRUCache
+from typing import Dict, Any, Optional, Literal
 from dataclasses import dataclass
 from uuid import uuid4
-from jsonschema import validate, ValidationError
+from jsonschema.protocols import Validator
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from logging import getLogger
+import asyncio
+import hashlib
+import inspect
+import json
+import math
+import time
+
+logger = getLogger(__name__)
+
+
+@lru_cache(maxsize=256)
+def _compile_validator(schema_json: str) -> Validator:
+    schema = json.loads(schema_json)
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+def compile_validator(schema: Dict[str, Any]) -> Validator:
+    """Compile a validator for a schema, shared by every tool using the same schema"""
+    return _compile_validator(json.dumps(schema, sort_keys=True))
+
+
+def _run_execute(tool: "Tool", input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the execute method of a tool in a worker thread or process"""
+    output_data = tool.execute(input_data)
+    if inspect.isawaitable(output_data):
+        output_data = asyncio.run(output_data)
+    return output_data
+
+
+class _InvalidOutput(ValueError):
+    """Raised when the output of execute does not match the output schema"""
+
+
+def _shutdown_executor(executor: Executor) -> None:
+    """Shut a pool down without waiting, terminating the processes of a process pool"""
+    executor.shutdown(wait=False, cancel_futures=True)
+    if isinstance(executor, ProcessPoolExecutor):
+        # Workers stuck in a call would otherwise keep running it
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
 
 
 @dataclass
@@ -14,9 +62,45 @@ class ToolConfig:
     queue_manager: QueueManager
     input_schema: Dict[str, Any]
     output_schema: Dict[str, Any]
+    max_concurrency: int = 1
+    # Register as a replica of the pool addressed by tool_name
+    pooled: bool = False
+    # Check the outputs of the tool against output_schema as well, the sender gets
+    # an error result in place of an invalid output
+    validate_output: bool = False
+    # Where execute runs: on the event loop, in a thread pool or in a process pool.
+    # A call cancelled at its deadline while running in a pool leaves the pool:
+    # later calls go to a fresh one, and in process mode the worker is terminated
+    # once the other calls running in the old pool are done. A thread cannot be
+    # stopped, it keeps running until execute returns
+    execution_mode: Literal["inline", "thread", "process"] = "inline"
+    # Size of the pool, max_concurrency by default
+    max_workers: Optional[int] = None
+    # Cache outputs per input for cache_ttl seconds, only for tools whose output
+    # depends on nothing but their input
+    cache_ttl: Optional[float] = None
+    cache_size: int = 1024
+    cache_redis: bool = False
 
 
 class Tool(Listener, ABC):
+    # Not needed by execute and not picklable, left behind by the process pool
+    _process_local_attributes = (
+        "queue_manager",
+        "listener_task",
+        "_slots",
+        "_intake",
+        "_in_flight",
+        "_conversation_tails",
+        "_connected_listeners",
+        "_executor",
+        "_executor_calls",
+        "result_cache",
+        "redis",
+        "input_validator",
+        "output_validator",
+    )
+
     def __init__(self, config: ToolConfig):
         self.tool_id = self._generate_listener_id(prefix="tool")
         tool_metadata = ListenerMetadata(
@@ -26,24 +110,171 @@ class Tool(Listener, ABC):
             description=config.description,
             input_schema=config.input_schema,
             output_schema=config.output_schema,
+            pooled=config.pooled,
         )
         self.input_schema = config.input_schema
         self.output_schema = config.output_schema
+        self.input_validator = compile_validator(config.input_schema)
+        self.output_validator = (
+            compile_validator(config.output_schema) if config.validate_output else None
+        )
+        assert config.execution_mode in (
+            "inline",
+            "thread",
+            "process",
+        ), f"Unknown execution mode: {config.execution_mode}"
+        self.execution_mode = config.execution_mode
+        self.max_workers = config.max_workers or config.max_concurrency
+        self._executor: Optional[Executor] = None
+        # Calls running in each pool, including pools retired after a timeout
+        self._executor_calls: Dict[Executor, int] = {}
+        self.cache_ttl = config.cache_ttl
+        self.result_cache = (
+            LRUCache(maxsize=config.cache_size, ttl=config.cache_ttl)
+            if config.cache_ttl
+            else None
+        )
+        self.redis = REDIS if config.cache_ttl and config.cache_redis else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Execution time saved by serving outputs from the cache
+        self.cache_saved_seconds = 0.0
 
-        super().__init__(config.queue_manager, tool_metadata)
+        super().__init__(
+            config.queue_manager,
+            tool_metadata,
+            max_concurrency=config.max_concurrency,
+        )
 
     async def _validate_input(self, message: Message) -> None:
-        try:
-            validate(message.data, self.input_schema)
-        except ValidationError as e:
-            raise ValueError(f"Invalid input: {e}")
+        if not self.input_validator.is_valid(message.data):
+            error = best_match(self.input_validator.iter_errors(message.data))
+            raise ValueError(f"Invalid input: {error}")
+
+    async def _validate_output(self, output_data: Dict[str, Any]) -> None:
+        if not self.output_validator.is_valid(output_data):
+            error = best_match(self.output_validator.iter_errors(output_data))
+            raise _InvalidOutput(f"Invalid output: {error}")
 
     async def _listen(
         self, message: Message, metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         await self._validate_input(message)
-        return await self.execute(message.data)
+        try:
+            return await self._execute_cached(message.data)
+        except _InvalidOutput as e:
+            # The sender waits for a result, an exception would leave it without one
+            logger.error(f"{self.listener_id}: {str(e)}")
+            return {"status": "error", "error": str(e)}
+
+    async def _execute_cached(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Serve the output from the cache, or execute and cache it"""
+        if self.result_cache is None:
+            return await self._execute_and_validate(input_data)
+
+        cache_key = self._cache_key(input_data)
+        cached = await self._get_cached(cache_key)
+        if cached is not None:
+            self.cache_hits += 1
+            self.cache_saved_seconds += cached["duration"]
+            return cached["output"]
+        self.cache_misses += 1
+        start = time.perf_counter()
+        output_data = await self._execute_and_validate(input_data)
+        await self._cache(
+            cache_key,
+            {"output": output_data, "duration": time.perf_counter() - start},
+        )
+        return output_data
+
+    async def _execute_and_validate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        output_data = await self._execute(input_data)
+        if self.output_validator is not None:
+            await self._validate_output(output_data)
+        return output_data
+
+    def _cache_key(self, input_data: Dict[str, Any]) -> str:
+        input_hash = hashlib.sha256(
+            json.dumps(input_data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        # Replicas of a tool share its cached outputs through Redis
+        return f"tool_results_{self.metadata.listener_name}_{input_hash}"
+
+    async def _get_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        cached = self.result_cache.get(cache_key)
+        if cached is None and self.redis is not None:
+            cached_data = await self.redis.get(cache_key)
+            if cached_data:
+                cached = json.loads(cached_data)
+                self.result_cache.set(cache_key, cached)
+        return cached
+
+    async def _cache(self, cache_key: str, cached: Dict[str, Any]):
+        self.result_cache.set(cache_key, cached)
+        if self.redis is not None:
+            try:
+                await self.redis.set(
+                    cache_key, json.dumps(cached), ex=math.ceil(self.cache_ttl)
+                )
+            except Exception as e:
+                logger.warning(f"Caching failed for {cache_key}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "saved_seconds": self.cache_saved_seconds,
+        }
+
+    async def _execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run execute according to the execution mode of the tool"""
+        if self.execution_mode == "inline":
+            return await self.execute(input_data)
+        if self._executor is None:
+            if self.execution_mode == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        executor = self._executor
+        self._executor_calls[executor] = self._executor_calls.get(executor, 0) + 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, _run_execute, self, input_data)
+        except asyncio.CancelledError:
+            # The worker is still busy with the call, keep later calls from
+            # queueing behind it
+            if executor is self._executor:
+                self._executor = None
+            raise
+        finally:
+            self._executor_calls[executor] -= 1
+            if executor is not self._executor and not self._executor_calls[executor]:
+                del self._executor_calls[executor]
+                _shutdown_executor(executor)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for attribute in self._process_local_attributes:
+            state.pop(attribute, None)
+        return state
+
+    async def stop(self):
+        await super().stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        # Retired pools are only left with calls that missed their deadline
+        for executor in set(self._executor_calls) - {self._executor}:
+            _shutdown_executor(executor)
+        self._executor_calls.clear()
+        self._executor = None
 
     @abstractmethod
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run the tool. With the thread or process execution mode this may also
+        be a plain blocking method, and in process mode its tool is pickled
+        into the worker with each input.
+        """
         pass